@@ -1,16 +1,65 @@
 import asyncio
-from typing import Dict, List, Any, Optional, Tuple
+import itertools
+import re
+import time
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple, TYPE_CHECKING
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
+from functools import cached_property
 import json
 from datetime import datetime
 
-from knowledge_base.vector_store import VectorStore
-from mcp.web_search_mcp import WebSearchMCP
-from feedback.dspy_feedback import MathLearningSystem
-from guardrails.input_guardrails import InputGuardrails, InputValidationResult
-from guardrails.output_guardrails import OutputGuardrails, OutputValidationResult
-from llm.gemini_client import GeminiClient
+# Subsystems are imported lazily by MathRoutingAgent to keep cold start cheap
+if TYPE_CHECKING:
+    from knowledge_base.vector_store import VectorStore
+    from mcp.web_search_mcp import WebSearchMCP
+    from feedback.dspy_feedback import MathLearningSystem
+    from guardrails.input_guardrails import InputGuardrails, InputValidationResult
+    from guardrails.output_guardrails import OutputGuardrails
+    from llm.gemini_client import GeminiClient
+
+# Patterns are compiled once at import time rather than on every request
+
+# Each complexity category contributes once; "concept" hits are counted
+_COMPLEXITY_CATEGORIES = {
+    "proof": r'prove|derive|show that|demonstrate',
+    "calculus": r'integral|derivative|limit|series|convergence',
+    "linear_algebra": r'matrix|vector|eigenvalue|determinant',
+    "statistics": r'probability|distribution|hypothesis|statistical',
+    "optimization": r'optimization|constraint|lagrange|calculus of variations',
+    "analysis": r'complex|imaginary|real analysis|topology',
+    "concept": r'equation|function|formula|theorem|lemma',
+}
+
+_COMPLEXITY_COMBINED = re.compile(
+    "|".join(rf'(?P<{name}>\b(?:{alternatives})\b)' for name, alternatives in _COMPLEXITY_CATEGORIES.items()),
+    re.IGNORECASE
+)
+
+# Extraction patterns are fused so each scans the web content once;
+# matches are taken in document order
+_STEP_RX = re.compile(
+    r'(?:(?:step \d+|first|second|third|next|finally)[:\-]|\d+[\.\)])\s*([^.]*\.)',
+    re.IGNORECASE
+)
+
+_ANSWER_RX = re.compile(
+    r'(?:(?:answer|result|solution)[:\-]\s*|(?:therefore|thus)[,\s]+)([^.]*\.)',
+    re.IGNORECASE
+)
+
+_EXPLANATION_RX = re.compile(
+    r'[^.]*(?:because|since|therefore|thus|we have|we get|we obtain)[^.]*\.',
+    re.IGNORECASE
+)
+
+# Concurrent knowledge base lookups are coalesced into one batched search
+KB_BATCH_WINDOW = 0.005  # seconds
+KB_BATCH_MAX_SIZE = 16
+
+# Recent question/answer pairs kept so feedback can be tied to its response
+MAX_TRACKED_SESSIONS = 1000
 
 class RouteDecision(Enum):
     KNOWLEDGE_BASE = "knowledge_base"
@@ -40,93 +89,201 @@ class MathRoutingAgent:
     """Main routing agent for mathematical problem solving"""
     
     def __init__(self):
-        self.vector_store = VectorStore()
-        self.web_search = WebSearchMCP()
-        self.learning_system = MathLearningSystem()
-        self.input_guardrails = InputGuardrails()
-        self.output_guardrails = OutputGuardrails()
-        self.gemini_client = GeminiClient()
-        self.session_counter = 0
+        self._id_counter = itertools.count(1)
+        self._session_responses: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._kb_batch_queue: Optional[asyncio.Queue] = None
+        self._kb_batch_worker: Optional[asyncio.Task] = None
+    
+    @cached_property
+    def vector_store(self) -> "VectorStore":
+        from knowledge_base.vector_store import VectorStore
+        return VectorStore()
+    
+    @cached_property
+    def web_search(self) -> "WebSearchMCP":
+        from mcp.web_search_mcp import WebSearchMCP
+        return WebSearchMCP()
+    
+    @cached_property
+    def learning_system(self) -> "MathLearningSystem":
+        from feedback.dspy_feedback import MathLearningSystem
+        return MathLearningSystem()
+    
+    @cached_property
+    def input_guardrails(self) -> "InputGuardrails":
+        from guardrails.input_guardrails import InputGuardrails
+        return InputGuardrails()
+    
+    @cached_property
+    def output_guardrails(self) -> "OutputGuardrails":
+        from guardrails.output_guardrails import OutputGuardrails
+        return OutputGuardrails()
+    
+    @cached_property
+    def gemini_client(self) -> "GeminiClient":
+        from llm.gemini_client import get_gemini
+        return get_gemini()
+    
+    def warm_up(self):
+        """Build the blocking subsystems now, e.g. from a startup thread, instead of on the first request"""
+        self.vector_store
+        self.web_search
+        self.learning_system
+        self.input_guardrails
+        self.output_guardrails
     
     def _generate_session_id(self) -> str:
         """Generate unique session ID"""
-        self.session_counter += 1
-        return f"math_session_{self.session_counter}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return f"math_session_{next(self._id_counter)}_{time.time_ns()}"
+    
+    def _track_session(self, session_id: str, question: str, answer: str):
+        """Remember a session's question and answer so feedback can be tied to it"""
+        self._session_responses[session_id] = (question, answer)
+        if len(self._session_responses) > MAX_TRACKED_SESSIONS:
+            self._session_responses.popitem(last=False)
+    
+    def replay_result(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a cached answer payload back into a result under a fresh session"""
+        session_id = self._generate_session_id()
+        response = dict(payload["response"], session_id=session_id, timestamp=datetime.now().isoformat())
+        self._track_session(session_id, response["question"], response["answer"])
+        return {**payload, "response": response, "session_id": session_id}
     
     async def process_question(self, question: str, user_id: str = "anonymous") -> Dict[str, Any]:
         """Main entry point for processing mathematical questions"""
         session_id = self._generate_session_id()
         
         try:
-            # Step 1: Input validation and guardrails
-            input_validation = self.input_guardrails.validate_input(question)
-            if not input_validation.is_valid:
-                return {
-                    "success": False,
-                    "error": "Input validation failed",
-                    "warnings": input_validation.warnings,
-                    "session_id": session_id
-                }
-            
-            # Step 2: Route decision
-            routing_result = await self._make_routing_decision(question, input_validation)
-            
-            if routing_result.decision == RouteDecision.REJECT:
-                return {
-                    "success": False,
-                    "error": "Question rejected",
-                    "reasoning": routing_result.reasoning,
-                    "session_id": session_id
-                }
+            # Steps 1-2: Input validation, knowledge base lookup and routing
+            rejection, input_validation, routing_result = await self._route_question(question, session_id)
+            if rejection:
+                return rejection
             
             # Step 3: Generate response based on routing decision
             response = await self._generate_response(question, routing_result, session_id)
             
             # Step 4: Output validation and guardrails
-            output_validation = self.output_guardrails.validate_output(response.answer, question)
-            
-            # Always return a result; treat validation as advisory unless content is clearly unsafe
-            # If sanitization produced text, prefer it
-            if output_validation.sanitized_output:
-                response.answer = output_validation.sanitized_output
+            return self._finalize_response(response, routing_result, input_validation)
             
+        except Exception as e:
             return {
-                "success": True,
-                "response": {
-                    "question": response.question,
-                    "answer": response.answer,
-                    "solution_steps": response.solution_steps,
-                    "explanation": response.explanation,
-                    "source": response.source,
-                    "confidence": response.confidence,
-                    "session_id": response.session_id,
-                    "timestamp": response.timestamp
-                },
-                "session_id": response.session_id,
-                "routing_info": {
-                    "decision": routing_result.decision.value,
-                    "confidence": routing_result.confidence,
-                    "reasoning": routing_result.reasoning
-                },
-                "validation_info": {
-                    "input_warnings": input_validation.warnings,
-                    "output_warnings": output_validation.warnings,
-                    "educational_value": output_validation.educational_value
-                }
+                "success": False,
+                "error": f"Processing failed: {str(e)}",
+                "session_id": session_id
             }
+    
+    async def process_question_stream(self, question: str, user_id: str = "anonymous") -> AsyncIterator[Dict[str, Any]]:
+        """Like process_question, but yields Gemini tokens as they arrive
+        
+        Yields ``{"event": "token", "data": text}`` while a web-search answer is
+        generated, then one ``{"event": "result", "data": ...}`` carrying the same
+        payload process_question returns. If Gemini fails mid-stream, an
+        ``{"event": "error", ...}`` precedes a result built from the search results.
+        """
+        session_id = self._generate_session_id()
+        
+        try:
+            rejection, input_validation, routing_result = await self._route_question(question, session_id)
+            if rejection:
+                yield {"event": "result", "data": rejection}
+                return
+            
+            if routing_result.decision == RouteDecision.KNOWLEDGE_BASE:
+                response = await self._generate_kb_response(question, routing_result, session_id)
+            else:
+                response = None
+                async for event in self._stream_web_response(question, session_id):
+                    if isinstance(event, MathResponse):
+                        response = event
+                    elif isinstance(event, dict):
+                        yield event
+                    else:
+                        yield {"event": "token", "data": event}
+            
+            yield {"event": "result", "data": self._finalize_response(response, routing_result, input_validation)}
             
         except Exception as e:
-            return {
+            yield {"event": "result", "data": {
                 "success": False,
                 "error": f"Processing failed: {str(e)}",
                 "session_id": session_id
+            }}
+    
+    async def _route_question(self, question: str, session_id: str
+                              ) -> Tuple[Optional[Dict[str, Any]], "InputValidationResult", Optional[RoutingResult]]:
+        """Validate and route a question; the first item is an error result when it is refused"""
+        # Input validation and guardrails, overlapped with the knowledge
+        # base lookup since neither depends on the other
+        input_validation, kb_results = await asyncio.gather(
+            asyncio.to_thread(self.input_guardrails.validate_input, question),
+            # Only the top hit is used for routing and KB responses
+            self._search_knowledge_base(question, limit=1, score_threshold=0.7)
+        )
+        if not input_validation.is_valid:
+            return {
+                "success": False,
+                "error": "Input validation failed",
+                "warnings": input_validation.warnings,
+                "session_id": session_id
+            }, input_validation, None
+        
+        # Route decision
+        routing_result = await self._make_routing_decision(question, input_validation, kb_results)
+        
+        if routing_result.decision == RouteDecision.REJECT:
+            return {
+                "success": False,
+                "error": "Question rejected",
+                "reasoning": routing_result.reasoning,
+                "session_id": session_id
+            }, input_validation, routing_result
+        
+        return None, input_validation, routing_result
+    
+    def _finalize_response(self, response: MathResponse, routing_result: RoutingResult,
+                           input_validation: "InputValidationResult") -> Dict[str, Any]:
+        """Apply output guardrails, remember the session and build the API result"""
+        output_validation = self.output_guardrails.validate_output(response.answer, response.question)
+        
+        # Always return a result; treat validation as advisory unless content is clearly unsafe
+        # If sanitization produced text, prefer it
+        if output_validation.sanitized_output:
+            response.answer = output_validation.sanitized_output
+        
+        self._track_session(response.session_id, response.question, response.answer)
+        
+        return {
+            "success": True,
+            "response": {
+                "question": response.question,
+                "answer": response.answer,
+                "solution_steps": response.solution_steps,
+                "explanation": response.explanation,
+                "source": response.source,
+                "confidence": response.confidence,
+                "session_id": response.session_id,
+                "timestamp": response.timestamp
+            },
+            "session_id": response.session_id,
+            "routing_info": {
+                "decision": routing_result.decision.value,
+                "confidence": routing_result.confidence,
+                "reasoning": routing_result.reasoning
+            },
+            "validation_info": {
+                "input_warnings": input_validation.warnings,
+                "output_warnings": output_validation.warnings,
+                "educational_value": output_validation.educational_value
             }
+        }
     
-    async def _make_routing_decision(self, question: str, input_validation: InputValidationResult) -> RoutingResult:
+    async def _make_routing_decision(self, question: str, input_validation: "InputValidationResult",
+                                     kb_results: Optional[List[Dict[str, Any]]] = None) -> RoutingResult:
         """Make routing decision between knowledge base and web search"""
         
-        # First, try knowledge base search
-        kb_results = self.vector_store.search(question, limit=3, score_threshold=0.7)
+        # First, try knowledge base search (unless the caller already prefetched it)
+        if kb_results is None:
+            kb_results = await self._search_knowledge_base(question, limit=1, score_threshold=0.7)
         
         if kb_results and kb_results[0]["score"] > 0.8:
             return RoutingResult(
@@ -140,7 +297,7 @@ class MathRoutingAgent:
         # If knowledge base has moderate results, check if we should use them
         if kb_results and kb_results[0]["score"] > 0.5:
             # Check if question is complex enough to warrant web search
-            complexity_score = self._assess_question_complexity(question)
+            complexity_score = self._assess_question_complexity(question, threshold=0.6)
             
             if complexity_score < 0.6:  # Simple question, use knowledge base
                 return RoutingResult(
@@ -159,27 +316,77 @@ class MathRoutingAgent:
             source="web_search"
         )
     
-    def _assess_question_complexity(self, question: str) -> float:
-        """Assess the complexity of a mathematical question"""
-        complexity_indicators = [
-            r'\b(prove|derive|show that|demonstrate)\b',
-            r'\b(integral|derivative|limit|series|convergence)\b',
-            r'\b(matrix|vector|eigenvalue|determinant)\b',
-            r'\b(probability|distribution|hypothesis|statistical)\b',
-            r'\b(optimization|constraint|lagrange|calculus of variations)\b',
-            r'\b(complex|imaginary|real analysis|topology)\b'
-        ]
+    async def _search_knowledge_base(self, question: str, limit: int = 1,
+                                     score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        """Queue a knowledge base search to be batched with concurrent requests"""
+        if self._kb_batch_worker is None or self._kb_batch_worker.done():
+            self._kb_batch_queue = asyncio.Queue()
+            self._kb_batch_worker = asyncio.create_task(self._run_kb_batcher())
         
-        import re
-        complexity_score = 0.0
+        future = asyncio.get_running_loop().create_future()
+        await self._kb_batch_queue.put((question, limit, score_threshold, future))
+        return await future
+    
+    async def _run_kb_batcher(self):
+        """Drain pending searches within a short window and run them as one batch"""
+        loop = asyncio.get_running_loop()
         
-        for pattern in complexity_indicators:
-            if re.search(pattern, question, re.IGNORECASE):
-                complexity_score += 0.2
+        while True:
+            batch = [await self._kb_batch_queue.get()]
+            deadline = loop.time() + KB_BATCH_WINDOW
+            
+            while len(batch) < KB_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._kb_batch_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Searches with the same parameters share a single batched call
+            groups: Dict[Tuple[int, float], List[Tuple[str, asyncio.Future]]] = {}
+            for question, limit, score_threshold, future in batch:
+                groups.setdefault((limit, score_threshold), []).append((question, future))
+            
+            for (limit, score_threshold), pending in groups.items():
+                try:
+                    results = await self.vector_store.asearch_batch(
+                        [question for question, _ in pending],
+                        limit=limit,
+                        score_threshold=score_threshold
+                    )
+                except Exception as e:
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, future), result in zip(pending, results):
+                    if not future.done():
+                        future.set_result(result)
+    
+    def _assess_question_complexity(self, question: str, threshold: float = 1.0) -> float:
+        """Assess the complexity of a mathematical question
         
-        # Check for multiple mathematical concepts
-        math_concepts = len(re.findall(r'\b(equation|function|formula|theorem|lemma)\b', question, re.IGNORECASE))
-        complexity_score += min(math_concepts * 0.1, 0.3)
+        Scanning stops as soon as the score reaches ``threshold``, so callers
+        that only compare against a cutoff can pass it to skip needless work.
+        """
+        categories = set()
+        math_concepts = 0
+        complexity_score = 0.0
+        
+        # Single pass over the question for all indicator categories
+        for match in _COMPLEXITY_COMBINED.finditer(question):
+            if match.lastgroup == "concept":
+                math_concepts += 1
+            else:
+                categories.add(match.lastgroup)
+            
+            # Each category counts once; multiple concepts add a capped bonus
+            complexity_score = len(categories) * 0.2 + min(math_concepts * 0.1, 0.3)
+            if complexity_score >= threshold:
+                break
         
         return min(complexity_score, 1.0)
     
@@ -213,83 +420,153 @@ class MathRoutingAgent:
     
     async def _generate_web_response(self, question: str, routing_result: RoutingResult, session_id: str) -> MathResponse:
         """Generate response from web search"""
+        # Near-duplicates of recently answered questions skip web search and Gemini entirely
+        cached = await self.vector_store.afind_answer(question)
+        if cached:
+            return self._cached_answer_response(question, cached, session_id)
+        
         web_results = await self.web_search.search_math_content(question, max_results=3)
         
         if not web_results:
-            return MathResponse(
+            return self._no_results_response(question, session_id)
+        
+        # Combine web results into context, joined once and shared by
+        # Gemini and the fallback extractors
+        combined_text = " ".join(result["content"] for result in web_results)
+        
+        # One structured Gemini request returns the solution, steps and final answer together
+        solved = await self.gemini_client.asolve_and_annotate(question, combined_text)
+        if solved["success"]:
+            response = MathResponse(
                 question=question,
-                answer="I apologize, but I couldn't find a suitable solution for your question. Please try rephrasing or providing more specific details.",
-                solution_steps=["Unable to find solution"],
-                explanation="No relevant mathematical content found in web search",
+                answer=solved["final_answer"],
+                solution_steps=solved["steps"],
+                explanation=solved["solution"],
                 source="web_search",
-                confidence=0.0,
+                confidence=solved["confidence"],
                 session_id=session_id,
                 timestamp=datetime.now().isoformat()
             )
+            await self._remember_answer(response)
+            return response
         
-        # Combine web results into context
-        combined_content = []
-        sources = []
-        
-        for result in web_results:
-            combined_content.append(result["content"])
-            sources.append({"title": result["title"], "url": result["url"]})
-        
-        context = " ".join(combined_content)
-        
-        # Use Gemini to generate a comprehensive response
-        gemini_response = self.gemini_client.generate_math_response(question, context)
+        # Legacy path: generate a free-form response, then parse it
+        gemini_response = await self.gemini_client.agenerate_math_response(question, combined_text)
         
         if gemini_response["success"]:
-            # Extract solution steps and final answer using Gemini
-            solution_steps = self.gemini_client.extract_solution_steps(gemini_response["response"])
-            final_answer = self.gemini_client.extract_final_answer(gemini_response["response"])
-            
-            return MathResponse(
-                question=question,
-                answer=final_answer,
-                solution_steps=solution_steps,
-                explanation=gemini_response["response"],
-                source="web_search",
-                confidence=gemini_response["confidence"],
-                session_id=session_id,
-                timestamp=datetime.now().isoformat()
+            return await self._parsed_response(
+                question, gemini_response["response"], gemini_response["confidence"], session_id
             )
         else:
             # Fallback to original method
-            solution_steps = self._extract_solution_steps(combined_content)
-            
-            return MathResponse(
-                question=question,
-                answer=self._extract_final_answer(combined_content),
-                solution_steps=solution_steps,
-                explanation=self._generate_explanation(combined_content),
-                source="web_search",
-                confidence=min(0.8, len(web_results) * 0.2),
-                session_id=session_id,
-                timestamp=datetime.now().isoformat()
-            )
+            return self._extracted_response(question, combined_text, web_results, session_id)
     
-    def _extract_solution_steps(self, content: List[str]) -> List[str]:
-        """Extract solution steps from web content"""
-        steps = []
-        combined_text = " ".join(content)
-        
-        # Look for step patterns
-        import re
-        step_patterns = [
-            r'step \d+[:\-]\s*([^.]*\.)',
-            r'\d+[\.\)]\s*([^.]*\.)',
-            r'first[:\-]\s*([^.]*\.)',
-            r'second[:\-]\s*([^.]*\.)',
-            r'third[:\-]\s*([^.]*\.)',
-            r'next[:\-]\s*([^.]*\.)',
-            r'finally[:\-]\s*([^.]*\.)'
-        ]
+    async def _stream_web_response(self, question: str, session_id: str) -> AsyncIterator[Any]:
+        """Yield Gemini text chunks for a web-search answer, then the finished MathResponse
+        
+        A streaming failure yields an "error" event instead, after which the
+        response is extracted from the search results.
+        """
+        cached = await self.vector_store.afind_answer(question)
+        if cached:
+            yield self._cached_answer_response(question, cached, session_id)
+            return
+        
+        web_results = await self.web_search.search_math_content(question, max_results=3)
+        if not web_results:
+            yield self._no_results_response(question, session_id)
+            return
+        
+        combined_text = " ".join(result["content"] for result in web_results)
+        chunks = []
+        try:
+            async for chunk in self.gemini_client.agenerate_math_response_stream(question, combined_text):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            print(f"Error streaming Gemini response for session {session_id}: {e}")
+            # Tokens already sent are superseded by the extracted answer in the result event
+            yield {"event": "error", "data": {
+                "error": f"Streaming failed: {str(e)}",
+                "session_id": session_id
+            }}
+            yield self._extracted_response(question, combined_text, web_results, session_id)
+            return
         
-        for pattern in step_patterns:
-            matches = re.findall(pattern, combined_text, re.IGNORECASE)
-            steps.extend(matches)
+        # Steps and the final answer are extracted once the full text has arrived
+        yield await self._parsed_response(question, "".join(chunks), 0.8, session_id)
+    
+    async def _parsed_response(self, question: str, text: str, confidence: float, session_id: str) -> MathResponse:
+        """Build and remember a response from free-form Gemini text"""
+        # Extract solution steps and final answer using Gemini
+        solution_steps, final_answer = await self.gemini_client.aparse_gemini_response(text)
+        
+        response = MathResponse(
+            question=question,
+            answer=final_answer,
+            solution_steps=solution_steps,
+            explanation=text,
+            source="web_search",
+            confidence=confidence,
+            session_id=session_id,
+            timestamp=datetime.now().isoformat()
+        )
+        await self._remember_answer(response)
+        return response
+    
+    def _cached_answer_response(self, question: str, cached: Dict[str, Any], session_id: str) -> MathResponse:
+        return MathResponse(
+            question=question,
+            answer=cached["answer"],
+            solution_steps=cached["solution_steps"],
+            explanation=cached["explanation"],
+            source="web_search",
+            confidence=cached["confidence"],
+            session_id=session_id,
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _no_results_response(self, question: str, session_id: str) -> MathResponse:
+        return MathResponse(
+            question=question,
+            answer="I apologize, but I couldn't find a suitable solution for your question. Please try rephrasing or providing more specific details.",
+            solution_steps=["Unable to find solution"],
+            explanation="No relevant mathematical content found in web search",
+            source="web_search",
+            confidence=0.0,
+            session_id=session_id,
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _extracted_response(self, question: str, combined_text: str,
+                            web_results: List[Dict[str, Any]], session_id: str) -> MathResponse:
+        """Build a response from the web content alone when Gemini is unavailable"""
+        solution_steps = self._extract_solution_steps(combined_text)
+        
+        return MathResponse(
+            question=question,
+            answer=self._extract_final_answer(combined_text),
+            solution_steps=solution_steps,
+            explanation=self._generate_explanation(combined_text),
+            source="web_search",
+            confidence=min(0.8, len(web_results) * 0.2),
+            session_id=session_id,
+            timestamp=datetime.now().isoformat()
+        )
+    
+    async def _remember_answer(self, response: MathResponse):
+        """Store a Gemini-generated answer in the semantic answer cache"""
+        await self.vector_store.astore_answer(response.question, {
+            "answer": response.answer,
+            "solution_steps": response.solution_steps,
+            "explanation": response.explanation,
+            "confidence": response.confidence
+        })
+    
+    def _extract_solution_steps(self, combined_text: str) -> List[str]:
+        """Extract solution steps from web content"""
+        # Look for step patterns (limit to 10 steps)
+        steps = [match.group(1) for match in itertools.islice(_STEP_RX.finditer(combined_text), 10)]
         
         # If no steps found, create generic steps
         if not steps:
@@ -300,61 +577,36 @@ class MathRoutingAgent:
                 "Verify the solution"
             ]
         
-        return steps[:10]  # Limit to 10 steps
+        return steps
     
-    def _extract_final_answer(self, content: List[str]) -> str:
+    def _extract_final_answer(self, combined_text: str) -> str:
         """Extract final answer from web content"""
-        combined_text = " ".join(content)
-        
         # Look for answer patterns
-        import re
-        answer_patterns = [
-            r'answer[:\-]\s*([^.]*\.)',
-            r'result[:\-]\s*([^.]*\.)',
-            r'solution[:\-]\s*([^.]*\.)',
-            r'therefore[,\s]+([^.]*\.)',
-            r'thus[,\s]+([^.]*\.)'
-        ]
-        
-        for pattern in answer_patterns:
-            match = re.search(pattern, combined_text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
+        match = _ANSWER_RX.search(combined_text)
+        if match:
+            return match.group(1).strip()
         
         return "Answer not explicitly stated in the sources"
     
-    def _generate_explanation(self, content: List[str]) -> str:
+    def _generate_explanation(self, combined_text: str) -> str:
         """Generate explanation from web content"""
-        combined_text = " ".join(content)
-        
-        # Extract explanation sentences
-        import re
-        explanation_sentences = []
-        
-        # Look for explanation patterns
-        explanation_patterns = [
-            r'[^.]*because[^.]*\.',
-            r'[^.]*since[^.]*\.',
-            r'[^.]*therefore[^.]*\.',
-            r'[^.]*thus[^.]*\.',
-            r'[^.]*we have[^.]*\.',
-            r'[^.]*we get[^.]*\.',
-            r'[^.]*we obtain[^.]*\.'
+        # Extract explanation sentences (limit to 3 sentences)
+        explanation_sentences = [
+            match.group(0) for match in itertools.islice(_EXPLANATION_RX.finditer(combined_text), 3)
         ]
         
-        for pattern in explanation_patterns:
-            matches = re.findall(pattern, combined_text, re.IGNORECASE)
-            explanation_sentences.extend(matches)
-        
         if explanation_sentences:
-            return " ".join(explanation_sentences[:3])  # Limit to 3 sentences
+            return " ".join(explanation_sentences)
         
         return "This solution is based on mathematical principles and step-by-step reasoning."
     
     async def collect_feedback(self, session_id: str, rating: int, comments: str = "") -> Dict[str, Any]:
         """Collect user feedback for a response"""
-        # This would be called by the API endpoint
-        # For now, return a placeholder
+        question, answer = self._session_responses.get(session_id, ("", ""))
+        await self.learning_system.aprocess_feedback(
+            question, answer, rating, comments, session_id
+        )
+        
         return {
             "success": True,
             "message": "Feedback collected successfully",
@@ -367,4 +619,13 @@ class MathRoutingAgent:
     
     async def close(self):
         """Clean up resources"""
-        await self.web_search.close()
+        if self._kb_batch_worker is not None:
+            self._kb_batch_worker.cancel()
+        # Only tear down subsystems that were actually created
+        if "learning_system" in self.__dict__:
+            await asyncio.to_thread(self.learning_system.feedback_collector.close)
+        if "web_search" in self.__dict__:
+            await self.web_search.close()
+        if "vector_store" in self.__dict__:
+            await self.vector_store.close()
+        # gemini_client is the process-wide get_gemini() instance; close_gemini() releases it at shutdown
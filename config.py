@@ -9,14 +9,29 @@ class Settings(BaseSettings):
     qdrant_url: str = os.getenv("QDRANT_URL", "http://localhost:6333")
     qdrant_api_key: Optional[str] = os.getenv("QDRANT_API_KEY")
     mcp_server_url: str = os.getenv("MCP_SERVER_URL", "http://localhost:3000")
+    redis_url: Optional[str] = os.getenv("REDIS_URL")
     
     # Model Configuration
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_backend: str = "onnx-int8"  # "onnx-int8" or "torch"
+    embedding_onnx_dir: str = "models/all-MiniLM-L6-v2-onnx-int8"
     llm_model: str = "gemini-2.5-flash"
+    gemini_cache_dir: str = "/tmp/gemini_cache"
     
     # Vector Database Configuration
     collection_name: str = "math_knowledge_base"
     vector_size: int = 384
+    vector_quantization: bool = True  # int8 scalar quantization with rescoring
+    quantization_oversampling: float = 2.0
+    fallback_index_path: str = "models/fallback_hnsw.faiss"
+    
+    # Semantic answer cache
+    answer_cache_threshold: float = 0.95  # minimum cosine similarity to reuse an answer
+    answer_cache_ttl: int = 24 * 3600  # seconds
+    
+    # API response cache
+    response_cache_ttl: int = 1800  # seconds
+    learning_mode_user_prefix: str = "learning"  # user_ids starting with this bypass the cache
     
     # Guardrails Configuration
     max_input_length: int = 1000
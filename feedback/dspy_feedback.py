@@ -5,14 +5,61 @@ except ImportError:
     DSPY_AVAILABLE = False
     print("Warning: DSPy not available, using fallback implementation")
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json as _json
+
+    _loads = _json.loads
+    _dumps = _json.dumps
+
 from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+from collections import Counter, deque
+import asyncio
 import json
 import os
+import queue
+import re
+import threading
 from datetime import datetime
 
+# Keywords are found in one case-insensitive pass; an improvement applies
+# when all of its keywords occur somewhere in the text
+_EVALUATION_KEYWORDS = re.compile(r'step|missing|explanation|unclear|answer|incorrect|format|poor', re.IGNORECASE)
+_EVALUATION_IMPROVEMENTS = (
+    (("step", "missing"), "add_more_steps"),
+    (("explanation", "unclear"), "improve_explanation"),
+    (("answer", "incorrect"), "fix_answer"),
+    (("format", "poor"), "improve_formatting"),
+)
+
+_COMMENT_KEYWORDS = re.compile(r'confusing|incomplete|wrong', re.IGNORECASE)
+_COMMENT_IMPROVEMENTS = {
+    "confusing": "improve_clarity",
+    "incomplete": "add_more_details",
+    "wrong": "verify_solution",
+}
+
+# Matches "accuracy: 0.8", "accuracy score: 8" or "accuracy = 0.8" for every metric in one sweep.
+# The forms keep their original priority: for each metric the first "metric:" wins, then the
+# first "metric score:", then the first "metric =", wherever they appear in the text
+_SCORE_METRICS = ("accuracy", "clarity", "completeness")
+_SCORE_FORMS = ("colon", "score", "equals")
+_SCORE_PATTERN = re.compile(
+    rf"({'|'.join(_SCORE_METRICS)})(?:(?P<colon>:)|(?P<score>\s*score:)|(?P<equals>\s*=))\s*(?P<value>\d+\.?\d*)",
+    re.IGNORECASE
+)
+
 @dataclass
 class FeedbackData:
+    __slots__ = ("question", "response", "user_rating", "user_comments", "timestamp", "session_id")
+
     question: str
     response: str
     user_rating: int  # 1-5 scale
@@ -25,7 +72,19 @@ class MathFeedbackCollector:
     
     def __init__(self):
         self.feedback_history = []
-        self.feedback_file = "feedback/feedback_history.json"
+        self.feedback_file = "feedback/feedback_history.jsonl"
+        # History was stored as a single JSON array before the append-only format
+        self.legacy_feedback_file = "feedback/feedback_history.json"
+        self._feedback_handle = None
+        self._rating_counts = Counter()
+        self._rating_sum = 0
+        self._recent_feedback = deque(maxlen=5)
+        self._write_queue: "queue.Queue[Optional[FeedbackData]]" = queue.Queue()
+        self._writer_thread: Optional[threading.Thread] = None
+        # Feedback arrives from worker threads: one lock for the history and
+        # rating stats, one so only a single writer thread is ever started
+        self._stats_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
         self._load_feedback_history()
     
     def collect_feedback(self, question: str, response: str, 
@@ -41,11 +100,14 @@ class MathFeedbackCollector:
             session_id=session_id
         )
         
-        self.feedback_history.append(feedback)
-        self._save_feedback_history()
+        with self._stats_lock:
+            self.feedback_history.append(feedback)
+            self._track_rating(feedback)
+            feedback_id = len(self.feedback_history)
+        self._enqueue_write(feedback)
         
         return {
-            "feedback_id": len(self.feedback_history),
+            "feedback_id": feedback_id,
             "status": "collected",
             "rating": rating,
             "timestamp": feedback.timestamp
@@ -53,74 +115,128 @@ class MathFeedbackCollector:
     
     def get_feedback_summary(self) -> Dict[str, Any]:
         """Get summary of all feedback collected"""
-        if not self.feedback_history:
-            return {"total_feedback": 0, "average_rating": 0.0}
-        
-        ratings = [f.user_rating for f in self.feedback_history]
-        return {
-            "total_feedback": len(self.feedback_history),
-            "average_rating": sum(ratings) / len(ratings),
-            "rating_distribution": {
-                "1": ratings.count(1),
-                "2": ratings.count(2),
-                "3": ratings.count(3),
-                "4": ratings.count(4),
-                "5": ratings.count(5)
-            },
-            "recent_feedback": self.feedback_history[-5:] if len(self.feedback_history) >= 5 else self.feedback_history
-        }
+        with self._stats_lock:
+            if not self.feedback_history:
+                return {"total_feedback": 0, "average_rating": 0.0}
+            
+            total = len(self.feedback_history)
+            return {
+                "total_feedback": total,
+                "average_rating": self._rating_sum / total,
+                "rating_distribution": {
+                    "1": self._rating_counts[1],
+                    "2": self._rating_counts[2],
+                    "3": self._rating_counts[3],
+                    "4": self._rating_counts[4],
+                    "5": self._rating_counts[5]
+                },
+                "recent_feedback": list(self._recent_feedback)
+            }
+    
+    def _track_rating(self, feedback: FeedbackData):
+        """Update running rating statistics with a new entry"""
+        self._rating_counts[feedback.user_rating] += 1
+        self._rating_sum += feedback.user_rating
+        self._recent_feedback.append(feedback)
     
     def _load_feedback_history(self):
-        """Load feedback history from file"""
+        """Load feedback history from file (one JSON object per line)"""
         try:
             if not os.path.exists(self.feedback_file):
-                # Initialize file with an empty array so future reads are valid JSON
-                os.makedirs(os.path.dirname(self.feedback_file), exist_ok=True)
-                with open(self.feedback_file, 'w') as f:
-                    json.dump([], f)
                 self.feedback_history = []
+                if os.path.exists(self.legacy_feedback_file):
+                    self._migrate_legacy_history()
                 return
 
-            # File exists — handle empty or malformed JSON gracefully
+            history = []
+            malformed = False
             with open(self.feedback_file, 'r') as f:
-                raw = f.read().strip()
-                if not raw:
-                    # Empty file: treat as no history and reinitialize
-                    self.feedback_history = []
-                    with open(self.feedback_file, 'w') as wf:
-                        json.dump([], wf)
-                    return
-                try:
-                    data = json.loads(raw)
-                except json.JSONDecodeError:
-                    # Malformed JSON: reset to empty history instead of crashing
-                    data = []
-                    with open(self.feedback_file, 'w') as wf:
-                        json.dump([], wf)
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        history.append(FeedbackData(**_loads(line)))
+                    except (json.JSONDecodeError, TypeError):
+                        # Skip malformed lines (e.g. a partially written entry)
+                        malformed = True
 
-                self.feedback_history = [FeedbackData(**item) for item in data]
+            self.feedback_history = history
+            for feedback in history:
+                self._track_rating(feedback)
+            if malformed:
+                # Rewrite the file without the malformed lines
+                self._save_feedback_history()
         except Exception as e:
             print(f"Error loading feedback history: {e}")
             self.feedback_history = []
     
+    def _migrate_legacy_history(self):
+        """Convert the old JSON-array history file once, through the atomic compaction path"""
+        try:
+            with open(self.legacy_feedback_file, 'r') as f:
+                raw = f.read().strip()
+            entries = json.loads(raw) if raw else []
+            history = [FeedbackData(**entry) for entry in entries]
+        except (OSError, json.JSONDecodeError, TypeError) as e:
+            print(f"Could not migrate legacy feedback history: {e}")
+            return
+        
+        self.feedback_history = history
+        for feedback in history:
+            self._track_rating(feedback)
+        self._save_feedback_history()
+        print(f"Migrated {len(history)} feedback entries to {self.feedback_file}")
+    
+    def _enqueue_write(self, feedback: FeedbackData):
+        """Hand a feedback entry to the single background writer"""
+        with self._writer_lock:
+            if self._writer_thread is None or not self._writer_thread.is_alive():
+                self._writer_thread = threading.Thread(target=self._run_writer, daemon=True)
+                self._writer_thread.start()
+            self._write_queue.put_nowait(feedback)
+    
+    def _run_writer(self):
+        """Write queued feedback entries until a None sentinel is received"""
+        while True:
+            feedback = self._write_queue.get()
+            if feedback is None:
+                break
+            self._append_feedback(feedback)
+    
+    def _append_feedback(self, feedback: FeedbackData):
+        """Append a single feedback entry to the history file"""
+        try:
+            if self._feedback_handle is None:
+                os.makedirs(os.path.dirname(self.feedback_file), exist_ok=True)
+                # Line buffered so every entry reaches the file as it is written
+                self._feedback_handle = open(self.feedback_file, 'a', buffering=1)
+            self._feedback_handle.write(_dumps(asdict(feedback)) + "\n")
+        except Exception as e:
+            print(f"Error saving feedback: {e}")
+    
     def _save_feedback_history(self):
-        """Save feedback history to file"""
+        """Atomically rewrite the full feedback history file (compaction)"""
         try:
+            self.close()
             os.makedirs(os.path.dirname(self.feedback_file), exist_ok=True)
-            with open(self.feedback_file, 'w') as f:
-                json.dump([
-                    {
-                        "question": f.question,
-                        "response": f.response,
-                        "user_rating": f.user_rating,
-                        "user_comments": f.user_comments,
-                        "timestamp": f.timestamp,
-                        "session_id": f.session_id
-                    }
-                    for f in self.feedback_history
-                ], f, indent=2)
+            tmp_file = f"{self.feedback_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                for feedback in self.feedback_history:
+                    f.write(_dumps(asdict(feedback)) + "\n")
+            os.replace(tmp_file, self.feedback_file)
         except Exception as e:
             print(f"Error saving feedback history: {e}")
+    
+    def close(self):
+        """Flush pending writes and close the history file handle"""
+        with self._writer_lock:
+            if self._writer_thread is not None and self._writer_thread.is_alive():
+                self._write_queue.put_nowait(None)
+                self._writer_thread.join()
+            self._writer_thread = None
+            if self._feedback_handle is not None:
+                self._feedback_handle.close()
+                self._feedback_handle = None
 
 class MathResponseEvaluator:
     """DSPy module for evaluating math responses"""
@@ -145,9 +261,10 @@ class MathResponseEvaluator:
             evaluation_text = evaluation.evaluation
             
             # Extract scores (assuming evaluation contains numerical scores)
-            accuracy_score = self._extract_score(evaluation_text, "accuracy")
-            clarity_score = self._extract_score(evaluation_text, "clarity")
-            completeness_score = self._extract_score(evaluation_text, "completeness")
+            scores = self._extract_scores(evaluation_text)
+            accuracy_score = scores["accuracy"]
+            clarity_score = scores["clarity"]
+            completeness_score = scores["completeness"]
             
             return {
                 "accuracy": accuracy_score,
@@ -169,46 +286,32 @@ class MathResponseEvaluator:
                 "needs_improvement": ["evaluation_error"]
             }
     
-    def _extract_score(self, text: str, metric: str) -> float:
-        """Extract numerical score for a specific metric"""
-        try:
-            # Look for patterns like "accuracy: 0.8" or "accuracy score: 8/10"
-            import re
-            patterns = [
-                rf"{metric}:\s*(\d+\.?\d*)",
-                rf"{metric}\s*score:\s*(\d+\.?\d*)",
-                rf"{metric}\s*=\s*(\d+\.?\d*)"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    score = float(match.group(1))
-                    # Normalize to 0-1 range if needed
-                    if score > 1:
-                        score = score / 10
-                    return min(max(score, 0), 1)
-            
-            return 0.5  # Default score if not found
-            
-        except Exception:
-            return 0.5
+    def _extract_scores(self, text: str) -> Dict[str, float]:
+        """Extract numerical scores for all metrics in a single pass"""
+        found = {}  # metric -> (form priority, raw score)
+        for match in _SCORE_PATTERN.finditer(text):
+            metric = match.group(1).lower()
+            priority = next(index for index, form in enumerate(_SCORE_FORMS) if match.group(form))
+            if metric not in found or priority < found[metric][0]:
+                found[metric] = (priority, float(match.group("value")))
+        
+        scores = {}
+        for metric, (_, score) in found.items():
+            # Normalize to 0-1 range if needed
+            if score > 1:
+                score = score / 10
+            scores[metric] = min(max(score, 0), 1)
+        
+        # Default score if not found
+        return {metric: scores.get(metric, 0.5) for metric in _SCORE_METRICS}
     
     def _identify_improvements(self, evaluation_text: str) -> List[str]:
         """Identify areas for improvement from evaluation text"""
-        improvements = []
-        
-        if "step" in evaluation_text.lower() and "missing" in evaluation_text.lower():
-            improvements.append("add_more_steps")
-        
-        if "explanation" in evaluation_text.lower() and "unclear" in evaluation_text.lower():
-            improvements.append("improve_explanation")
-        
-        if "answer" in evaluation_text.lower() and "incorrect" in evaluation_text.lower():
-            improvements.append("fix_answer")
-        
-        if "format" in evaluation_text.lower() and "poor" in evaluation_text.lower():
-            improvements.append("improve_formatting")
+        hits = {match.group(0).lower() for match in _EVALUATION_KEYWORDS.finditer(evaluation_text)}
+        improvements = [
+            improvement for keywords, improvement in _EVALUATION_IMPROVEMENTS
+            if hits.issuperset(keywords)
+        ]
         
         return improvements
 
@@ -219,6 +322,20 @@ class MathLearningSystem:
         self.feedback_collector = MathFeedbackCollector()
         self.evaluator = MathResponseEvaluator()
         self.learning_data = []
+        
+        # Running aggregates so insights don't rescan learning_data
+        self._sum_rating = 0
+        self._sum_accuracy = 0.0
+        self._sum_clarity = 0.0
+        self._sum_completeness = 0.0
+        self._improvement_counter = Counter()
+        
+        # Last five entries plus totals for everything older, for trend analysis
+        self._recent = deque(maxlen=5)
+        self._older_rating_sum = 0
+        self._older_count = 0
+        # process_feedback runs in worker threads via aprocess_feedback
+        self._lock = threading.Lock()
     
     def process_feedback(self, question: str, response: str, 
                         user_rating: int, user_comments: str = "",
@@ -243,10 +360,26 @@ class MathLearningSystem:
             "timestamp": datetime.now().isoformat(),
             "session_id": session_id
         }
-        self.learning_data.append(learning_entry)
         
         # Generate improvement suggestions
         improvements = self._generate_improvements(learning_entry)
+        learning_entry["improvements"] = improvements
+        
+        with self._lock:
+            self.learning_data.append(learning_entry)
+            
+            # Update running aggregates
+            self._sum_rating += user_rating
+            self._sum_accuracy += evaluation["accuracy"]
+            self._sum_clarity += evaluation["clarity"]
+            self._sum_completeness += evaluation["completeness"]
+            self._improvement_counter.update(improvements)
+            
+            if len(self._recent) == self._recent.maxlen:
+                oldest = self._recent.popleft()
+                self._older_rating_sum += oldest["user_rating"]
+                self._older_count += 1
+            self._recent.append(learning_entry)
         
         return {
             "feedback_collected": feedback_result,
@@ -255,13 +388,22 @@ class MathLearningSystem:
             "learning_updated": True
         }
     
+    async def aprocess_feedback(self, question: str, response: str,
+                                user_rating: int, user_comments: str = "",
+                                session_id: str = "") -> Dict[str, Any]:
+        """Async variant of process_feedback that keeps file IO and evaluation off the event loop"""
+        return await asyncio.to_thread(
+            self.process_feedback,
+            question, response, user_rating, user_comments, session_id
+        )
+    
     def _generate_improvements(self, learning_entry: Dict[str, Any]) -> List[str]:
         """Generate improvement suggestions based on feedback and evaluation"""
         improvements = []
         
         user_rating = learning_entry["user_rating"]
         evaluation = learning_entry["evaluation"]
-        user_comments = learning_entry["user_comments"].lower()
+        user_comments = learning_entry["user_comments"]
         
         # Based on user rating
         if user_rating <= 2:
@@ -279,60 +421,38 @@ class MathLearningSystem:
             improvements.append("add_more_steps")
         
         # Based on user comments
-        if "confusing" in user_comments:
-            improvements.append("improve_clarity")
-        
-        if "incomplete" in user_comments:
-            improvements.append("add_more_details")
+        comment_hits = {match.group(0).lower() for match in _COMMENT_KEYWORDS.finditer(user_comments)}
+        for keyword, improvement in _COMMENT_IMPROVEMENTS.items():
+            if keyword in comment_hits:
+                improvements.append(improvement)
         
-        if "wrong" in user_comments:
-            improvements.append("verify_solution")
-        
-        return list(set(improvements))  # Remove duplicates
+        return list(dict.fromkeys(improvements))  # Remove duplicates, keeping order
     
     def get_learning_insights(self) -> Dict[str, Any]:
         """Get insights from the learning system"""
-        if not self.learning_data:
-            return {"insights": "No learning data available"}
-        
-        # Calculate average scores
-        avg_user_rating = sum(entry["user_rating"] for entry in self.learning_data) / len(self.learning_data)
-        avg_accuracy = sum(entry["evaluation"]["accuracy"] for entry in self.learning_data) / len(self.learning_data)
-        avg_clarity = sum(entry["evaluation"]["clarity"] for entry in self.learning_data) / len(self.learning_data)
-        avg_completeness = sum(entry["evaluation"]["completeness"] for entry in self.learning_data) / len(self.learning_data)
-        
-        # Find common improvement areas
-        all_improvements = []
-        for entry in self.learning_data:
-            all_improvements.extend(entry.get("improvements", []))
-        
-        improvement_counts = {}
-        for improvement in all_improvements:
-            improvement_counts[improvement] = improvement_counts.get(improvement, 0) + 1
-        
-        return {
-            "total_interactions": len(self.learning_data),
-            "average_user_rating": avg_user_rating,
-            "average_accuracy": avg_accuracy,
-            "average_clarity": avg_clarity,
-            "average_completeness": avg_completeness,
-            "common_improvements": sorted(improvement_counts.items(), key=lambda x: x[1], reverse=True)[:5],
-            "recent_trends": self._analyze_recent_trends()
-        }
+        with self._lock:
+            if not self.learning_data:
+                return {"insights": "No learning data available"}
+            
+            total = len(self.learning_data)
+            
+            return {
+                "total_interactions": total,
+                "average_user_rating": self._sum_rating / total,
+                "average_accuracy": self._sum_accuracy / total,
+                "average_clarity": self._sum_clarity / total,
+                "average_completeness": self._sum_completeness / total,
+                "common_improvements": self._improvement_counter.most_common(5),
+                "recent_trends": self._analyze_recent_trends()
+            }
     
     def _analyze_recent_trends(self) -> Dict[str, Any]:
         """Analyze recent trends in feedback"""
-        if len(self.learning_data) < 5:
-            return {"trend": "insufficient_data"}
-        
-        recent_entries = self.learning_data[-5:]
-        older_entries = self.learning_data[:-5] if len(self.learning_data) > 5 else []
-        
-        if not older_entries:
+        if len(self._recent) < 5 or not self._older_count:
             return {"trend": "insufficient_data"}
         
-        recent_avg_rating = sum(entry["user_rating"] for entry in recent_entries) / len(recent_entries)
-        older_avg_rating = sum(entry["user_rating"] for entry in older_entries) / len(older_entries)
+        recent_avg_rating = sum(entry["user_rating"] for entry in self._recent) / len(self._recent)
+        older_avg_rating = self._older_rating_sum / self._older_count
         
         trend = "improving" if recent_avg_rating > older_avg_rating else "declining"
         
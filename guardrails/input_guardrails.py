@@ -1,7 +1,46 @@
 import re
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel, validator
 from config import settings
+from guardrails.regex_engine import compile_pattern
+
+VALIDATION_CACHE_SIZE = 4096
+
+# Patterns are compiled once at import time rather than on every validation
+
+# Math scoring categories, in scoring order: three keyword groups, operators,
+# numbers and single-letter variables. Keywords and variables are whole words,
+# so one tokenization pass plus set lookups replaces a regex per category
+_MATH_KEYWORD_GROUPS = (
+    frozenset(["solve", "calculate", "find", "compute", "evaluate", "integrate", "differentiate", "derive"]),
+    frozenset(["equation", "formula", "function", "matrix", "vector", "limit", "derivative", "integral"]),
+    frozenset(["algebra", "calculus", "geometry", "trigonometry", "statistics", "probability"]),
+)
+_MATH_VARIABLES = frozenset("xyzabcdefghijklmnopqrstuvw")
+_OPERATOR_TABLE = str.maketrans('', '', '+-*/=<>(){}[]^')
+_WORD = compile_pattern(r'\w+')
+_DIGIT_RUN = compile_pattern(r'\d+')
+
+_HARMFUL_PATTERNS = [
+    r'\b(hack|exploit|bypass|cheat|illegal|harmful|dangerous)\b',
+    r'<script.*?>.*?</script>',  # Script injection
+    r'javascript:',  # JavaScript injection
+    r'data:text/html',  # Data URI injection
+]
+
+# Harmful patterns are fused into one alternation so the text is scanned once
+_HARMFUL_UNION = compile_pattern("|".join(f"(?:{p})" for p in _HARMFUL_PATTERNS), re.IGNORECASE)
+
+# Characters removed by sanitization, stripped with str.translate
+_STRIP_TABLE = str.maketrans('', '', '<>"\'')
+
+def _math_score_from_counts(counts: List[int]) -> float:
+    """Average of per-category match counts, each normalized to 0-1"""
+    score = 0.0
+    for matches in counts:
+        score += min(matches / 10, 1.0)
+    return min(score / len(counts), 1.0)
 
 class InputValidationResult(BaseModel):
     is_valid: bool
@@ -16,29 +55,12 @@ class InputGuardrails:
     def __init__(self):
         self.allowed_topics = settings.allowed_topics
         self.max_length = settings.max_input_length
-        self.math_patterns = [
-            r'\b(solve|calculate|find|compute|evaluate|integrate|differentiate|derive)\b',
-            r'\b(equation|formula|function|matrix|vector|limit|derivative|integral)\b',
-            r'\b(algebra|calculus|geometry|trigonometry|statistics|probability)\b',
-            r'[+\-*/=<>(){}[\]^]',  # Math operators
-            r'\d+',  # Numbers
-            r'\b(x|y|z|a|b|c|d|e|f|g|h|i|j|k|l|m|n|o|p|q|r|s|t|u|v|w)\b',  # Variables
-        ]
-        
-        self.potentially_harmful_patterns = [
-            r'\b(hack|exploit|bypass|cheat|illegal|harmful|dangerous)\b',
-            r'<script.*?>.*?</script>',  # Script injection
-            r'javascript:',  # JavaScript injection
-            r'data:text/html',  # Data URI injection
-        ]
+        # Validation is a pure function of the text, so repeated inputs are memoized
+        self._validate_cached = lru_cache(maxsize=VALIDATION_CACHE_SIZE)(self._validate_input_uncached)
     
     def validate_input(self, user_input: str) -> InputValidationResult:
         """Validate and sanitize user input"""
-        warnings = []
-        confidence_score = 0.0
-        detected_topic = "general"
-        
-        # Length validation
+        # Length validation (before the cache so oversized input is never stored)
         if len(user_input) > self.max_length:
             return InputValidationResult(
                 is_valid=False,
@@ -48,16 +70,31 @@ class InputGuardrails:
                 warnings=[f"Input too long. Maximum {self.max_length} characters allowed."]
             )
         
-        # Check for potentially harmful content
-        for pattern in self.potentially_harmful_patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return InputValidationResult(
-                    is_valid=False,
-                    sanitized_input="",
-                    confidence_score=0.0,
-                    detected_topic="",
-                    warnings=["Potentially harmful content detected."]
-                )
+        # Harmful content is rejected on the raw text, before sanitization strips markers
+        # like <script>, and before the cache so rejected floods can't evict real entries
+        if _HARMFUL_UNION.search(user_input):
+            return InputValidationResult(
+                is_valid=False,
+                sanitized_input="",
+                confidence_score=0.0,
+                detected_topic="",
+                warnings=["Potentially harmful content detected."]
+            )
+        
+        is_valid, sanitized_input, confidence_score, detected_topic, warnings = self._validate_cached(user_input)
+        return InputValidationResult(
+            is_valid=is_valid,
+            sanitized_input=sanitized_input,
+            confidence_score=confidence_score,
+            detected_topic=detected_topic,
+            warnings=list(warnings)
+        )
+    
+    def _validate_input_uncached(self, user_input: str) -> Tuple[bool, str, float, str, Tuple[str, ...]]:
+        """Run the checks for accepted input, returning a hashable tuple for caching"""
+        warnings = []
+        confidence_score = 0.0
+        detected_topic = "general"
         
         # Sanitize input
         sanitized_input = self._sanitize_input(user_input)
@@ -75,33 +112,40 @@ class InputGuardrails:
         if detected_topic not in self.allowed_topics and detected_topic != "general":
             warnings.append(f"Topic '{detected_topic}' may not be supported.")
         
-        return InputValidationResult(
-            is_valid=True,
-            sanitized_input=sanitized_input,
-            confidence_score=confidence_score,
-            detected_topic=detected_topic,
-            warnings=warnings
-        )
+        return True, sanitized_input, confidence_score, detected_topic, tuple(warnings)
     
     def _sanitize_input(self, input_text: str) -> str:
         """Sanitize input text"""
         # Remove potentially dangerous characters
-        sanitized = re.sub(r'[<>"\']', '', input_text)
-        # Normalize whitespace
-        sanitized = re.sub(r'\s+', ' ', sanitized).strip()
-        return sanitized
+        sanitized = input_text.translate(_STRIP_TABLE)
+        # Normalize whitespace (split() also drops leading/trailing runs)
+        return ' '.join(sanitized.split())
     
     def _calculate_math_score(self, text: str) -> float:
         """Calculate confidence score for mathematical content"""
-        score = 0.0
-        total_patterns = len(self.math_patterns)
+        keyword_counts = [0] * len(_MATH_KEYWORD_GROUPS)
+        numbers = 0
+        variables = 0
+        
+        # Operators are single characters: count what translate() strips
+        operators = len(text) - len(text.translate(_OPERATOR_TABLE))
         
-        for pattern in self.math_patterns:
-            matches = len(re.findall(pattern, text, re.IGNORECASE))
-            if matches > 0:
-                score += min(matches / 10, 1.0)  # Normalize to 0-1
+        for word in _WORD.findall(text):
+            lowered = word.lower()
+            if lowered in _MATH_VARIABLES:
+                variables += 1
+            elif word.isdecimal():
+                numbers += 1
+            else:
+                for i, keywords in enumerate(_MATH_KEYWORD_GROUPS):
+                    if lowered in keywords:
+                        keyword_counts[i] += 1
+                        break
+                if not word.isalpha():
+                    # Digit runs inside mixed words such as "x2" still count as numbers
+                    numbers += len(_DIGIT_RUN.findall(word))
         
-        return min(score / total_patterns, 1.0)
+        return _math_score_from_counts(keyword_counts + [operators, numbers, variables])
     
     def _detect_math_topic(self, text: str) -> str:
         """Detect specific mathematical topic"""
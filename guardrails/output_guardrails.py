@@ -1,7 +1,87 @@
 import re
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from config import settings
+from guardrails.regex_engine import compile_pattern
+
+VALIDATION_CACHE_SIZE = 4096
+
+# Patterns are compiled once at import time rather than on every validation
+_QUALITY_INDICATORS = [compile_pattern(p, re.IGNORECASE) for p in [
+    r'\b(step \d+:|first|second|third|next|finally)\b',
+    r'\b(therefore|thus|hence|so|because|since)\b',
+    r'\b(we have|we get|we obtain|we find)\b',
+    r'[=+\-*/]',  # Mathematical operations
+    r'\$\$.*?\$\$',  # LaTeX math expressions
+]]
+
+_INAPPROPRIATE_PATTERNS = [compile_pattern(p, re.IGNORECASE) for p in [
+    r'\b(cheat|hack|illegal|harmful|dangerous)\b',
+    r'<script.*?>.*?</script>',
+    r'javascript:',
+    r'data:text/html',
+]]
+
+# One scan feeds both the confidence and the educational score. Each named group is
+# binned by lastgroup; groups that several original patterns matched are shared in
+# _score_features. LaTeX spans and subscripts keep their own scans because the
+# tokens inside them are counted independently.
+_OUTPUT_UNION = compile_pattern(
+    r'(?P<step_label>\bstep \d+:\b)'
+    r'|(?P<step>step \d+)'
+    r'|(?P<ordinal>\b(?:first|second|third)\b)'
+    r'|(?P<sequence>\b(?:next|finally)\b)'
+    r'|(?P<sequence_part>first|second|third|next|finally)'
+    r'|(?P<logic>\b(?:because|since|therefore|thus|hence|so)\b)'
+    r'|(?P<we>\b(?:we have|we get|we obtain|we find)\b)'
+    r'|(?P<we_see>\bwe can see\b)'
+    r'|(?P<lets>\b(?:let\'s|let us)\b)'
+    r'|(?P<operator>[=+\-*/])'
+    r'|(?P<number>\d+)'
+    r'|(?P<variable>(?-i:\b[xyzabc]\b))'
+    r'|(?P<caret>\^)',
+    re.IGNORECASE
+)
+_LATEX = compile_pattern(r'\$\$.*?\$\$')
+_SUBSCRIPT = compile_pattern(r'_\w+')
+
+_STEP_NUMBER = compile_pattern(r'step \d+', re.IGNORECASE)
+_REASONING = compile_pattern(r'\b(because|since|therefore|thus|hence)\b', re.IGNORECASE)
+_FINAL_ANSWER = compile_pattern(r'\b(answer|result|solution|final)\b', re.IGNORECASE)
+_MATH_OPERATORS = '=+-*/'
+_NUMBER_OR_VARIABLE = compile_pattern(r'\d+|\b(x|y|z|a|b|c)\b')
+
+# Characters removed by sanitization, stripped with str.translate
+_STRIP_TABLE = str.maketrans('', '', '<>"\'')
+
+def _score_features(text: str) -> Dict[str, int]:
+    """Count every scoring feature of a response in a single union scan"""
+    counts = dict.fromkeys(_OUTPUT_UNION.groupindex, 0)
+    for match in _OUTPUT_UNION.finditer(text):
+        counts[match.lastgroup] += 1
+    counts["latex"] = len(_LATEX.findall(text))
+    counts["subscript"] = len(_SUBSCRIPT.findall(text))
+    return counts
+
+def _confidence_from_counts(quality_counts: List[int], math_count: int, step_count: int) -> float:
+    """Combine quality, math and step match counts into a confidence score"""
+    score = 0.0
+    for matches in quality_counts:
+        score += min(matches * 0.1, 0.3)  # Cap at 0.3 per pattern
+    score += min(math_count * 0.05, 0.4)  # Cap at 0.4
+    score += min(step_count * 0.1, 0.3)  # Cap at 0.3
+    return min(score, 1.0)
+
+def _educational_from_counts(explanation_counts: List[int], notation_count: int, has_steps: bool) -> float:
+    """Combine explanation and notation match counts into an educational value"""
+    value = 0.0
+    for matches in explanation_counts:
+        value += min(matches * 0.1, 0.3)
+    value += min(notation_count * 0.05, 0.4)
+    if has_steps:
+        value += 0.3
+    return min(value, 1.0)
 
 class OutputValidationResult(BaseModel):
     is_valid: bool
@@ -21,26 +101,14 @@ class OutputGuardrails:
             "final answer"
         ]
         
-        self.quality_indicators = [
-            r'\b(step \d+:|first|second|third|next|finally)\b',
-            r'\b(therefore|thus|hence|so|because|since)\b',
-            r'\b(we have|we get|we obtain|we find)\b',
-            r'[=+\-*/]',  # Mathematical operations
-            r'\$\$.*?\$\$',  # LaTeX math expressions
-        ]
-        
-        self.inappropriate_patterns = [
-            r'\b(cheat|hack|illegal|harmful|dangerous)\b',
-            r'<script.*?>.*?</script>',
-            r'javascript:',
-            r'data:text/html',
-        ]
+        self.quality_indicators = _QUALITY_INDICATORS
+        self.inappropriate_patterns = _INAPPROPRIATE_PATTERNS
+        # Validation is a pure function of its inputs, so repeated responses are memoized
+        self._validate_cached = lru_cache(maxsize=VALIDATION_CACHE_SIZE)(self._validate_output_uncached)
     
     def validate_output(self, response: str, original_question: str) -> OutputValidationResult:
         """Validate and sanitize AI response"""
-        warnings = []
-        
-        # Length validation
+        # Length validation (before the cache so oversized output is never stored)
         if len(response) > self.max_length:
             return OutputValidationResult(
                 is_valid=False,
@@ -50,25 +118,37 @@ class OutputGuardrails:
                 warnings=[f"Response too long. Maximum {self.max_length} characters allowed."]
             )
         
+        is_valid, sanitized_output, confidence_score, educational_value, warnings = self._validate_cached(
+            response, original_question
+        )
+        return OutputValidationResult(
+            is_valid=is_valid,
+            sanitized_output=sanitized_output,
+            confidence_score=confidence_score,
+            educational_value=educational_value,
+            warnings=list(warnings)
+        )
+    
+    def _validate_output_uncached(self, response: str, original_question: str) -> Tuple[bool, str, float, float, Tuple[str, ...]]:
+        """Run the content checks, returning a hashable tuple for caching"""
+        warnings = []
+        
         # Check for inappropriate content
         for pattern in self.inappropriate_patterns:
-            if re.search(pattern, response, re.IGNORECASE):
-                return OutputValidationResult(
-                    is_valid=False,
-                    sanitized_output="",
-                    confidence_score=0.0,
-                    educational_value=0.0,
-                    warnings=["Inappropriate content detected in response."]
-                )
+            if pattern.search(response):
+                return False, "", 0.0, 0.0, ("Inappropriate content detected in response.",)
         
         # Sanitize output
         sanitized_output = self._sanitize_output(response)
         
+        # Count scoring features once for both scores
+        counts = _score_features(sanitized_output)
+        
         # Calculate confidence score
-        confidence_score = self._calculate_confidence_score(sanitized_output, original_question)
+        confidence_score = self._calculate_confidence_score(counts)
         
         # Calculate educational value
-        educational_value = self._calculate_educational_value(sanitized_output)
+        educational_value = self._calculate_educational_value(counts)
         
         # Check for required elements
         missing_elements = self._check_required_elements(sanitized_output)
@@ -80,83 +160,69 @@ class OutputGuardrails:
         if not math_validation["is_valid"]:
             warnings.extend(math_validation["warnings"])
         
-        return OutputValidationResult(
-            is_valid=confidence_score > 0.1 and educational_value > 0.1,  # Very low thresholds for testing
-            sanitized_output=sanitized_output,
-            confidence_score=confidence_score,
-            educational_value=educational_value,
-            warnings=warnings
-        )
+        is_valid = confidence_score > 0.1 and educational_value > 0.1  # Very low thresholds for testing
+        return is_valid, sanitized_output, confidence_score, educational_value, tuple(warnings)
     
     def _sanitize_output(self, output_text: str) -> str:
         """Sanitize output text"""
         # Remove potentially dangerous characters
-        sanitized = re.sub(r'[<>"\']', '', output_text)
-        # Normalize whitespace
-        sanitized = re.sub(r'\s+', ' ', sanitized).strip()
-        return sanitized
+        sanitized = output_text.translate(_STRIP_TABLE)
+        # Normalize whitespace (split() also drops leading/trailing runs)
+        return ' '.join(sanitized.split())
     
-    def _calculate_confidence_score(self, response: str, question: str) -> float:
+    def _calculate_confidence_score(self, counts: Dict[str, int]) -> float:
         """Calculate confidence score based on response quality"""
-        score = 0.0
+        steps = counts["step"] + counts["step_label"]
+        ordinals = counts["ordinal"] + counts["sequence"]
         
         # Check for quality indicators
-        for pattern in self.quality_indicators:
-            matches = len(re.findall(pattern, response, re.IGNORECASE))
-            score += min(matches * 0.1, 0.3)  # Cap at 0.3 per pattern
+        quality_counts = [
+            counts["step_label"] + ordinals,
+            counts["logic"],
+            counts["we"],
+            counts["operator"],
+            counts["latex"]
+        ]
         
-        # Check for mathematical content
-        math_patterns = [r'[=+\-*/]', r'\d+', r'\b(x|y|z|a|b|c)\b']
-        math_score = sum(len(re.findall(pattern, response)) for pattern in math_patterns)
-        score += min(math_score * 0.05, 0.4)  # Cap at 0.4
+        # Check for mathematical content (every step label holds one number)
+        math_count = counts["operator"] + counts["number"] + steps + counts["variable"]
         
         # Check for step-by-step structure
-        step_patterns = [r'step \d+', r'first', r'second', r'third', r'next', r'finally']
-        step_score = sum(len(re.findall(pattern, response, re.IGNORECASE)) for pattern in step_patterns)
-        score += min(step_score * 0.1, 0.3)  # Cap at 0.3
+        step_count = steps + ordinals + counts["sequence_part"]
         
-        return min(score, 1.0)
+        return _confidence_from_counts(quality_counts, math_count, step_count)
     
-    def _calculate_educational_value(self, response: str) -> float:
+    def _calculate_educational_value(self, counts: Dict[str, int]) -> float:
         """Calculate educational value of the response"""
-        value = 0.0
-        
         # Check for explanations
-        explanation_patterns = [
-            r'\b(because|since|therefore|thus|hence|so)\b',
-            r'\b(we have|we get|we obtain|we find|we can see)\b',
-            r'\b(let\'s|let us|first|second|third)\b'
+        explanation_counts = [
+            counts["logic"],
+            counts["we"] + counts["we_see"],
+            counts["lets"] + counts["ordinal"]
         ]
         
-        for pattern in explanation_patterns:
-            matches = len(re.findall(pattern, response, re.IGNORECASE))
-            value += min(matches * 0.1, 0.3)
-        
         # Check for mathematical notation
-        notation_patterns = [r'\$\$.*?\$\$', r'[=+\-*/]', r'\^', r'_\w+']
-        notation_score = sum(len(re.findall(pattern, response)) for pattern in notation_patterns)
-        value += min(notation_score * 0.05, 0.4)
+        notation_count = counts["latex"] + counts["operator"] + counts["caret"] + counts["subscript"]
         
         # Check for step-by-step structure
-        if re.search(r'step \d+', response, re.IGNORECASE):
-            value += 0.3
+        has_steps = counts["step"] + counts["step_label"] > 0
         
-        return min(value, 1.0)
+        return _educational_from_counts(explanation_counts, notation_count, has_steps)
     
     def _check_required_elements(self, response: str) -> List[str]:
         """Check for required educational elements"""
         missing = []
         
         # Check for step-by-step solution
-        if not re.search(r'step \d+', response, re.IGNORECASE):
+        if not _STEP_NUMBER.search(response):
             missing.append("step-by-step solution")
         
         # Check for mathematical reasoning
-        if not re.search(r'\b(because|since|therefore|thus|hence)\b', response, re.IGNORECASE):
+        if not _REASONING.search(response):
             missing.append("mathematical reasoning")
         
         # Check for final answer
-        if not re.search(r'\b(answer|result|solution|final)\b', response, re.IGNORECASE):
+        if not _FINAL_ANSWER.search(response):
             missing.append("final answer")
         
         return missing
@@ -166,11 +232,11 @@ class OutputGuardrails:
         warnings = []
         
         # Check for mathematical operations
-        if not re.search(r'[=+\-*/]', response):
+        if not any(operator in response for operator in _MATH_OPERATORS):
             warnings.append("No mathematical operations found")
         
         # Check for numbers or variables
-        if not re.search(r'\d+|\b(x|y|z|a|b|c)\b', response):
+        if not _NUMBER_OR_VARIABLE.search(response):
             warnings.append("No mathematical variables or numbers found")
         
         # Check for balanced parentheses
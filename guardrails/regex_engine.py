@@ -0,0 +1,71 @@
+import re
+from typing import Optional
+
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# RE2 takes flags inline rather than as re-module flag bits
+_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.DOTALL, "s"), (re.MULTILINE, "m"))
+
+# RE2's \w and \d are ASCII-only; these property classes match what re's Unicode
+# \w (str.isalnum() or "_") and \d (decimal digits) match
+_UNICODE_CLASSES = {"w": r"\p{L}\p{N}_", "d": r"\p{Nd}"}
+# Escapes RE2 can only match in ASCII and cannot be rewritten without lookaround
+_ASCII_ONLY_ESCAPES = frozenset("bBsSW")
+
+def _re2_pattern(pattern: str) -> Optional[str]:
+    """Rewrite \\w and \\d as Unicode classes for RE2, or None if re must run the pattern"""
+    out = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escape = pattern[i + 1]
+            if escape in _ASCII_ONLY_ESCAPES:
+                return None
+            if escape in _UNICODE_CLASSES:
+                unicode_class = _UNICODE_CLASSES[escape]
+                out.append(unicode_class if in_class else f"[{unicode_class}]")
+            else:
+                out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if char == "[" and not in_class:
+            # A "]" right after "[" or "[^" is a literal, not the end of the class
+            end = i + 1
+            if pattern[end:end + 1] == "^":
+                end += 1
+            if pattern[end:end + 1] == "]":
+                end += 1
+            out.append(pattern[i:end])
+            in_class = True
+            i = end
+            continue
+        if char == "]" and in_class:
+            in_class = False
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+def compile_pattern(pattern: str, flags: int = 0):
+    """Compile a guardrail pattern with RE2 when available, otherwise with re
+    
+    RE2 matches in linear time, so validation cost stays bounded on long or
+    adversarial input. \\w and \\d are rewritten so they stay Unicode-aware
+    under RE2; patterns using \\b, \\B, \\s, \\S or \\W, and patterns RE2
+    rejects (e.g. backreferences), are compiled with Python's engine so every
+    pattern matches the same text either way.
+    """
+    if RE2_AVAILABLE:
+        re2_pattern = _re2_pattern(pattern)
+        if re2_pattern is not None:
+            inline = "".join(letter for flag, letter in _INLINE_FLAGS if flags & flag)
+            try:
+                return re2.compile(f"(?{inline}){re2_pattern}" if inline else re2_pattern)
+            except Exception:
+                pass
+    return re.compile(pattern, flags)
@@ -1,18 +1,36 @@
 import json
+import re
+from functools import reduce
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Set, Tuple
 from dataclasses import dataclass
 
-@dataclass
+_TOKEN = re.compile(r'[^\W_]+')
+
+def _tokenize(text: str) -> Set[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    return set(_TOKEN.findall(text.lower()))
+
+@dataclass(frozen=True)
 class MathProblem:
+    __slots__ = (
+        "id", "question", "topic", "difficulty", "solution_steps",
+        "final_answer", "explanation", "related_concepts"
+    )
+
     id: str
     question: str
     topic: str
     difficulty: str
-    solution_steps: List[str]
+    solution_steps: Tuple[str, ...]
     final_answer: str
     explanation: str
-    related_concepts: List[str]
+    related_concepts: Tuple[str, ...]
+    
+    def __post_init__(self):
+        # Store sequences as tuples so frozen problems stay hashable
+        object.__setattr__(self, "solution_steps", tuple(self.solution_steps))
+        object.__setattr__(self, "related_concepts", tuple(self.related_concepts))
 
 class MathDataset:
     """Mathematical knowledge base dataset"""
@@ -20,6 +38,15 @@ class MathDataset:
     def __init__(self):
         self.problems = []
         self._create_sample_dataset()
+        self._build_index()
+    
+    def _build_index(self):
+        """Map each token of a problem's question, topic and concepts to problem indices"""
+        self._index: Dict[str, Set[int]] = {}
+        for i, problem in enumerate(self.problems):
+            text = f"{problem.question} {problem.topic} {' '.join(problem.related_concepts)}"
+            for token in _tokenize(text):
+                self._index.setdefault(token, set()).add(i)
     
     def _create_sample_dataset(self):
         """Create a comprehensive mathematical dataset"""
@@ -171,27 +198,25 @@ class MathDataset:
         return [p for p in self.problems if p.difficulty == difficulty]
     
     def search_problems(self, query: str) -> List[MathProblem]:
-        """Search problems by query string"""
-        query_lower = query.lower()
-        results = []
+        """Search problems whose question, topic or related concepts contain every query word"""
+        tokens = _tokenize(query)
+        if not tokens:
+            return list(self.problems)
         
-        for problem in self.problems:
-            # Check if query matches question, topic, or related concepts
-            if (query_lower in problem.question.lower() or
-                query_lower in problem.topic.lower() or
-                any(query_lower in concept.lower() for concept in problem.related_concepts)):
-                results.append(problem)
+        if not all(token in self._index for token in tokens):
+            return []
         
-        return results
+        matches = reduce(set.intersection, (self._index[token] for token in tokens))
+        return [self.problems[i] for i in sorted(matches)]
     
     def get_all_problems(self) -> List[MathProblem]:
         """Get all problems in the dataset"""
         return self.problems
     
-    def to_dict(self) -> List[Dict[str, Any]]:
-        """Convert dataset to dictionary format for vectorization"""
-        return [
-            {
+    def iter_dicts(self) -> Iterator[Dict[str, Any]]:
+        """Yield documents for vectorization one at a time, without materializing the list"""
+        for problem in self.problems:
+            yield {
                 "id": problem.id,
                 "question": problem.question,
                 "topic": problem.topic,
@@ -202,6 +227,7 @@ class MathDataset:
                 "concepts": " ".join(problem.related_concepts),
                 "content": f"{problem.question} {problem.explanation} {' '.join(problem.solution_steps)}"
             }
-            for problem in self.problems
-        ]
-
+    
+    def to_dict(self) -> List[Dict[str, Any]]:
+        """Convert dataset to dictionary format for vectorization"""
+        return list(self.iter_dicts())
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+from typing import List, Optional, Union
+import numpy as np
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    from huggingface_hub import hf_hub_download
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+QUANTIZED_FILE = "model_quantized.onnx"
+# Holds the max_seq_length sentence-transformers truncates inputs to
+SENTENCE_CONFIG_FILE = "sentence_bert_config.json"
+
+class OnnxEmbedder:
+    """Sentence embeddings computed with ONNX Runtime on a dynamically int8-quantized model"""
+    
+    def __init__(self, model_name: str, model_dir: str):
+        if not os.path.exists(os.path.join(model_dir, QUANTIZED_FILE)):
+            self._export_quantized_model(model_name, model_dir)
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=QUANTIZED_FILE,
+            provider="CPUExecutionProvider"
+        )
+        # Truncate like sentence-transformers (256 tokens for MiniLM), not at the
+        # tokenizer's 512, so both backends embed long documents the same way
+        self.max_seq_length = self._read_max_seq_length(model_name, model_dir)
+    
+    @staticmethod
+    def _read_max_seq_length(model_name: str, model_dir: str) -> Optional[int]:
+        """max_seq_length from the sentence-transformers config, if the model has one"""
+        path = os.path.join(model_dir, SENTENCE_CONFIG_FILE)
+        try:
+            if not os.path.exists(path):
+                path = hf_hub_download(model_name, SENTENCE_CONFIG_FILE)
+            with open(path, encoding="utf-8") as f:
+                return json.load(f).get("max_seq_length")
+        except Exception as e:
+            print(f"Could not read max_seq_length for {model_name}: {e}")
+            return None
+    
+    def _export_quantized_model(self, model_name: str, model_dir: str):
+        """Export the model to ONNX and apply dynamic int8 quantization"""
+        print(f"Exporting {model_name} to ONNX (int8) in {model_dir}...")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model.save_pretrained(model_dir)
+        tokenizer.save_pretrained(model_dir)
+        try:
+            shutil.copy(hf_hub_download(model_name, SENTENCE_CONFIG_FILE), model_dir)
+        except Exception as e:
+            print(f"Could not copy {SENTENCE_CONFIG_FILE} for {model_name}: {e}")
+        
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=model_dir, quantization_config=quantization_config)
+    
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Encode sentences like SentenceTransformer.encode (mean pooled, L2 normalized)"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            inputs = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+            
+            # Mean pooling over non-padding tokens
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = summed / counts
+            
+            # L2 normalize, matching the sentence-transformers pipeline
+            norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.append((pooled / norms).astype(np.float32))
+        
+        result = np.concatenate(embeddings, axis=0) if embeddings else np.empty((0, 0), dtype=np.float32)
+        return result[0] if single else result
@@ -1,11 +1,79 @@
+import asyncio
+import json
 import os
-from typing import List, Dict, Any, Optional
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice, zip_longest
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, SearchRequest, SearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, QuantizationSearchParams,
+    Filter, FieldCondition, MatchValue, PayloadSchemaType
+)
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from config import settings
 from .math_dataset import MathDataset
+from .onnx_embedder import OnnxEmbedder, ONNX_AVAILABLE
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+    print("Warning: faiss not available, fallback search will use a linear scan")
+
+# Numbers, single-letter variables and operators of a question, in order. Embeddings
+# barely separate "2x+3=7" from "2x+3=9", so cached answers must match on these exactly
+_MATH_TOKEN = re.compile(r"\d+(?:\.\d+)?|(?<![A-Za-z])[A-Za-z](?![A-Za-z])|[-+*/^=<>()\u00d7\u00f7\u221a\u00b2\u00b3]")
+
+def _math_signature(question: str) -> str:
+    """Normalized math content of a question, e.g. 'Solve 2x + 3 = 7.0' -> '2 x + 3 = 7'"""
+    tokens = []
+    for token in _MATH_TOKEN.findall(question):
+        if token[0].isdigit():
+            # Exact textual normalization: 07 -> 7, 7.50 -> 7.5, 7.0 -> 7
+            integer, _, fraction = token.partition(".")
+            token = (integer.lstrip("0") or "0") + ("." + fraction.rstrip("0") if fraction.rstrip("0") else "")
+        tokens.append(token.lower())
+    return " ".join(tokens)
+
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+UPLOAD_BATCH_SIZE = 64
+UPLOAD_PARALLELISM = 2
+POPULATE_CHUNK_SIZE = 64
+
+# lru_cache doesn't stop two threads building the same embedder, so loads are serialized
+_EMBEDDER_LOAD_LOCK = threading.Lock()
+
+def _get_embedder(name: str, backend: str):
+    """Load an embedding model once per process and share it across VectorStore instances"""
+    with _EMBEDDER_LOAD_LOCK:
+        return _load_embedder(name, backend)
+
+def _effective_backend(backend: str) -> str:
+    """Backend _load_embedder actually uses; onnx-int8 falls back to torch without optimum"""
+    return backend if backend == "onnx-int8" and ONNX_AVAILABLE else "torch"
+
+@lru_cache(maxsize=None)
+def _load_embedder(name: str, backend: str):
+    if backend == "onnx-int8":
+        if ONNX_AVAILABLE:
+            return OnnxEmbedder(name, settings.embedding_onnx_dir)
+        print("Warning: optimum[onnxruntime] not available, using sentence-transformers")
+    
+    import torch
+    model = SentenceTransformer(name)
+    if torch.cuda.is_available():
+        model.half()
+    else:
+        torch.set_num_threads(os.cpu_count() or 1)
+    return model
 
 class VectorStore:
     """Vector database for mathematical knowledge base"""
@@ -15,9 +83,17 @@ class VectorStore:
             url=settings.qdrant_url,
             api_key=settings.qdrant_api_key
         )
-        self.embedding_model = SentenceTransformer(settings.embedding_model)
+        self.async_client = AsyncQdrantClient(
+            url=settings.qdrant_url,
+            api_key=settings.qdrant_api_key
+        )
+        self.embedding_model = _get_embedder(settings.embedding_model, settings.embedding_backend)
         self.collection_name = settings.collection_name
+        self.answers_collection = f"{settings.collection_name}_answers"
         self.vector_size = settings.vector_size
+        self.search_params = self._build_search_params()
+        self._query_embeddings: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
         self._initialize_collection()
     
     def _initialize_collection(self):
@@ -27,127 +103,487 @@ class VectorStore:
             collections = self.client.get_collections()
             collection_names = [col.name for col in collections.collections]
             
-            if self.collection_name not in collection_names:
-                # Create collection
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.vector_size,
-                        distance=Distance.COSINE
+            # The answers collection backs the semantic answer cache
+            for name in (self.collection_name, self.answers_collection):
+                if name not in collection_names:
+                    # Create collection
+                    self.client.create_collection(
+                        collection_name=name,
+                        vectors_config=VectorParams(
+                            size=self.vector_size,
+                            distance=Distance.COSINE
+                        ),
+                        quantization_config=self._build_quantization_config()
                     )
-                )
-                print(f"Created collection: {self.collection_name}")
-            else:
-                print(f"Collection {self.collection_name} already exists")
+                    if name == self.answers_collection:
+                        # Cached answers are only reused on an exact math-signature match
+                        self.client.create_payload_index(
+                            collection_name=name,
+                            field_name="math_signature",
+                            field_schema=PayloadSchemaType.KEYWORD
+                        )
+                    print(f"Created collection: {name}")
+                else:
+                    print(f"Collection {name} already exists")
                 
         except Exception as e:
             print(f"Error initializing collection: {e}")
             # Fallback to in-memory storage
             self._use_fallback_storage()
     
+    def _build_quantization_config(self) -> Optional[ScalarQuantization]:
+        """Int8 scalar quantization kept in RAM; fp32 originals stay on disk for rescoring"""
+        if not settings.vector_quantization:
+            return None
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                always_ram=True
+            )
+        )
+    
+    def _build_search_params(self) -> Optional[SearchParams]:
+        """Search the quantized vectors, then rescore oversampled candidates at full precision"""
+        if not settings.vector_quantization:
+            return None
+        return SearchParams(
+            quantization=QuantizationSearchParams(
+                rescore=True,
+                oversampling=settings.quantization_oversampling
+            )
+        )
+    
     def _use_fallback_storage(self):
         """Fallback to in-memory storage if Qdrant is not available"""
         self.collection_name = "fallback_collection"
-        self.vectors = {}
+        # The semantic answer cache needs Qdrant; without it lookups simply miss
+        self.answers_collection = None
+        self._reset_fallback()
+        self._load_fallback_index()
+    
+    def _reset_fallback(self):
+        """Empty the in-memory fallback rows and index"""
+        self._vec_matrix = None
+        self._vec_i8 = None
+        self._row_scale = None
+        self._index = None
+        self._ids = []
         self.metadata = {}
     
-    def add_documents(self, documents: List[Dict[str, Any]]):
-        """Add documents to the vector store"""
+    def _encode_documents(self, documents: List[Dict[str, Any]]) -> np.ndarray:
+        """Embed all documents in batched forward passes"""
+        contents = [
+            doc.get("content", f"{doc.get('question', '')} {doc.get('explanation', '')}")
+            for doc in documents
+        ]
+        return self.embedding_model.encode(
+            contents,
+            batch_size=64,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True
+        )
+    
+    @staticmethod
+    def _payload(doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Stored fields of a document; "content" is only the embedding input and duplicates the rest"""
+        return {key: value for key, value in doc.items() if key != "content"}
+    
+    def add_documents(self, documents: List[Dict[str, Any]], start_id: int = 0,
+                      parallel: int = UPLOAD_PARALLELISM, wait: bool = True):
+        """Add documents to the vector store, numbering them from start_id
+        
+        ``parallel`` > 1 uploads through a multiprocessing pool, which only pays
+        off for many batches; ``wait`` blocks until the points are searchable.
+        """
+        embeddings = None
         try:
-            points = []
-            for i, doc in enumerate(documents):
-                # Create embedding
-                content = doc.get("content", f"{doc.get('question', '')} {doc.get('explanation', '')}")
-                embedding = self.embedding_model.encode(content).tolist()
-                
-                # Create point
-                point = PointStruct(
-                    id=i,
-                    vector=embedding,
-                    payload=doc
-                )
-                points.append(point)
+            embeddings = self._encode_documents(documents)
             
-            # Upsert points
-            self.client.upsert(
+            # Chunked upload; the embedding matrix is sent as-is
+            self.client.upload_collection(
                 collection_name=self.collection_name,
-                points=points
+                vectors=embeddings,
+                payload=(self._payload(doc) for doc in documents),
+                ids=range(start_id, start_id + len(documents)),
+                batch_size=UPLOAD_BATCH_SIZE,
+                parallel=parallel,
+                wait=wait
             )
-            print(f"Added {len(points)} documents to vector store")
+            print(f"Added {len(documents)} documents to vector store")
             
         except Exception as e:
             print(f"Error adding documents: {e}")
-            # Fallback to in-memory storage
-            self._add_to_fallback(documents)
+            # Fallback to in-memory storage, reusing embeddings if they were computed
+            self._add_to_fallback(documents, embeddings, start_id)
     
-    def _add_to_fallback(self, documents: List[Dict[str, Any]]):
-        """Add documents to fallback storage"""
-        for i, doc in enumerate(documents):
-            content = doc.get("content", f"{doc.get('question', '')} {doc.get('explanation', '')}")
-            embedding = self.embedding_model.encode(content).tolist()
-            self.vectors[i] = embedding
-            self.metadata[i] = doc
+    def _add_to_fallback(self, documents: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None,
+                         start_id: int = 0):
+        """Add documents to fallback storage; start_id 0 starts a fresh store, later ids append"""
+        if embeddings is None:
+            embeddings = self._encode_documents(documents)
+        if start_id == 0 or not getattr(self, '_ids', None):
+            self._reset_fallback()
+        
+        # L2-normalized float32 rows; row i belongs to self._ids[i]
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+        ids = list(range(start_id, start_id + len(documents)))
+        self._ids.extend(ids)
+        self.metadata.update(zip(ids, map(self._payload, documents)))
+        
+        if FAISS_AVAILABLE:
+            if self._index is None:
+                self._index = self._new_hnsw_index(matrix.shape[1])
+            self._index.add(np.ascontiguousarray(matrix))
+            return
+        
+        if settings.vector_quantization:
+            # Normalized components lie in [-1, 1], so a fixed 1/127 scale per row suffices
+            rows = np.round(matrix * 127).astype(np.int8)
+            scale = np.full(len(rows), 1 / 127, dtype=np.float32)
+            self._vec_i8 = rows if self._vec_i8 is None else np.vstack((self._vec_i8, rows))
+            self._row_scale = scale if self._row_scale is None else np.concatenate((self._row_scale, scale))
+        else:
+            self._vec_matrix = matrix if self._vec_matrix is None else np.vstack((self._vec_matrix, matrix))
     
     def search(self, query: str, limit: int = 5, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
         """Search for similar documents"""
         try:
             # Create query embedding
-            query_embedding = self.embedding_model.encode(query).tolist()
+            query_embedding = self._embed_query(query)
             
             # Search in Qdrant
             search_results = self.client.search(
                 collection_name=self.collection_name,
-                query_vector=query_embedding,
+                query_vector=list(query_embedding),
                 limit=limit,
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                search_params=self.search_params
             )
             
-            results = []
-            for result in search_results:
-                results.append({
-                    "id": result.id,
-                    "score": result.score,
-                    "content": result.payload
-                })
-            
-            return results
+            return self._format_results(search_results)
             
         except Exception as e:
             print(f"Error searching vector store: {e}")
             # Fallback to in-memory search
             return self._search_fallback(query, limit, score_threshold)
     
+    async def asearch(self, query: str, limit: int = 5, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        """Async variant of search that doesn't block the event loop"""
+        try:
+            # Create query embedding
+            query_embedding = await asyncio.to_thread(self._embed_query, query)
+            
+            # Search in Qdrant
+            search_results = await self.async_client.search(
+                collection_name=self.collection_name,
+                query_vector=list(query_embedding),
+                limit=limit,
+                score_threshold=score_threshold,
+                search_params=self.search_params
+            )
+            
+            return self._format_results(search_results)
+            
+        except Exception as e:
+            print(f"Error searching vector store: {e}")
+            # Fallback to in-memory search
+            return await asyncio.to_thread(self._search_fallback, query, limit, score_threshold)
+    
+    def search_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """Search for several queries in a single round trip"""
+        if not queries:
+            return []
+        
+        try:
+            # Encode all uncached queries in one forward pass
+            query_embeddings = self._embed_queries(queries)
+            
+            # Search in Qdrant
+            batch_results = self.client.search_batch(
+                collection_name=self.collection_name,
+                requests=self._batch_requests(query_embeddings, limit, score_threshold)
+            )
+            
+            return [self._format_results(search_results) for search_results in batch_results]
+            
+        except Exception as e:
+            print(f"Error batch searching vector store: {e}")
+            # Fallback to in-memory search
+            return [self._search_fallback(query, limit, score_threshold) for query in queries]
+    
+    async def asearch_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """Async variant of search_batch that doesn't block the event loop"""
+        if not queries:
+            return []
+        
+        try:
+            # Encode all uncached queries in one forward pass
+            query_embeddings = await asyncio.to_thread(self._embed_queries, queries)
+            
+            # Search in Qdrant
+            batch_results = await self.async_client.search_batch(
+                collection_name=self.collection_name,
+                requests=self._batch_requests(query_embeddings, limit, score_threshold)
+            )
+            
+            return [self._format_results(search_results) for search_results in batch_results]
+            
+        except Exception as e:
+            print(f"Error batch searching vector store: {e}")
+            # Fallback to in-memory search
+            return await asyncio.to_thread(
+                lambda: [self._search_fallback(query, limit, score_threshold) for query in queries]
+            )
+    
+    async def afind_answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Stored answer for a near-duplicate question with the same numbers, variables and operators"""
+        if self.answers_collection is None:
+            return None
+        
+        try:
+            query_embedding = await asyncio.to_thread(self._embed_query, question)
+            hits = await self.async_client.search(
+                collection_name=self.answers_collection,
+                query_vector=list(query_embedding),
+                # A similar wording is not enough: numbers, variables and operators must be identical
+                query_filter=Filter(must=[FieldCondition(
+                    key="math_signature", match=MatchValue(value=_math_signature(question))
+                )]),
+                limit=1,
+                score_threshold=settings.answer_cache_threshold,
+                search_params=self.search_params
+            )
+            if hits and time.time() - hits[0].payload.get("timestamp", 0) <= settings.answer_cache_ttl:
+                return hits[0].payload
+        except Exception as e:
+            print(f"Error searching answer cache: {e}")
+        return None
+    
+    async def astore_answer(self, question: str, answer: Dict[str, Any]):
+        """Remember a generated answer for semantically similar future questions"""
+        if self.answers_collection is None:
+            return
+        
+        try:
+            query_embedding = await asyncio.to_thread(self._embed_query, question)
+            await self.async_client.upsert(
+                collection_name=self.answers_collection,
+                points=[PointStruct(
+                    # One point per question text, so re-asking refreshes the entry
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, question)),
+                    vector=list(query_embedding),
+                    payload={
+                        **answer,
+                        "question": question,
+                        "math_signature": _math_signature(question),
+                        "timestamp": time.time()
+                    }
+                )],
+                wait=False
+            )
+        except Exception as e:
+            print(f"Error storing answer: {e}")
+    
+    def _embed_query(self, query: str) -> Tuple[float, ...]:
+        """Normalized embedding of a single query, served from the LRU cache when possible"""
+        return self._embed_queries([query])[0]
+    
+    def _embed_queries(self, queries: List[str]) -> List[Tuple[float, ...]]:
+        """Normalized query embeddings; only cache misses go through the model, in one batch"""
+        cache = self._query_embeddings
+        with self._query_embeddings_lock:
+            # Keep references to the hits so a concurrent eviction cannot drop them
+            embeddings_by_query = {query: cache[query] for query in queries if query in cache}
+        misses = list(dict.fromkeys(query for query in queries if query not in embeddings_by_query))
+        
+        if misses:
+            embeddings = self.embedding_model.encode(
+                misses,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                normalize_embeddings=True
+            )
+            embeddings_by_query.update(
+                (query, tuple(embedding.tolist())) for query, embedding in zip(misses, embeddings)
+            )
+        
+        results = [embeddings_by_query[query] for query in queries]
+        with self._query_embeddings_lock:
+            for query, embedding in embeddings_by_query.items():
+                cache[query] = embedding
+                cache.move_to_end(query)
+            while len(cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                cache.popitem(last=False)
+        return results
+    
+    def _batch_requests(self, query_embeddings, limit: int, score_threshold: float) -> List[SearchRequest]:
+        """Build one Qdrant search request per query embedding"""
+        return [
+            SearchRequest(
+                vector=list(embedding),
+                limit=limit,
+                score_threshold=score_threshold,
+                params=self.search_params,
+                with_payload=True
+            )
+            for embedding in query_embeddings
+        ]
+    
+    def _format_results(self, search_results) -> List[Dict[str, Any]]:
+        """Convert Qdrant scored points into result dicts"""
+        return [
+            {
+                "id": result.id,
+                "score": result.score,
+                "content": result.payload
+            }
+            for result in search_results
+        ]
+    
     def _search_fallback(self, query: str, limit: int, score_threshold: float) -> List[Dict[str, Any]]:
         """Fallback search in memory"""
-        if not hasattr(self, 'vectors'):
+        if not getattr(self, '_ids', None):
             return []
         
-        query_embedding = self.embedding_model.encode(query).tolist()
+        query_embedding = np.asarray(self._embed_query(query), dtype=np.float32)
+        k = min(limit, len(self._ids))
+        if k <= 0:
+            return []
+        
+        if self._index is not None:
+            # HNSW returns the k best rows already ordered by inner product
+            scores, rows = self._index.search(query_embedding[None, :], k)
+            scores, rows = scores[0], rows[0]
+        else:
+            # Partial top-k selection, then sort only the k survivors
+            all_scores = self._fallback_scores(query_embedding)
+            rows = np.argpartition(all_scores, -k)[-k:]
+            rows = rows[np.argsort(all_scores[rows])[::-1]]
+            scores = all_scores[rows]
+        
         results = []
+        for score, row in zip(scores, rows):
+            similarity = float(score)
+            if row < 0 or similarity < score_threshold:
+                break
+            doc_id = self._ids[row]
+            results.append({
+                "id": doc_id,
+                "score": similarity,
+                "content": self.metadata[doc_id]
+            })
+        return results
+    
+    def _new_hnsw_index(self, dimension: int):
+        """Create an empty inner-product HNSW index for normalized rows"""
+        index = faiss.IndexHNSWFlat(dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        return index
+    
+    @staticmethod
+    def _fallback_meta_path() -> str:
+        """Sidecar file holding the ids and payloads of the persisted fallback index"""
+        return f"{settings.fallback_index_path}.meta.json"
+    
+    def _persist_fallback_index(self):
+        """Write the fallback HNSW index and its payloads to disk, if one was built"""
+        if getattr(self, '_index', None) is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(settings.fallback_index_path) or ".", exist_ok=True)
+            faiss.write_index(self._index, settings.fallback_index_path)
+            with open(self._fallback_meta_path(), "w", encoding="utf-8") as f:
+                json.dump({
+                    "embedding_model": settings.embedding_model,
+                    "embedding_backend": _effective_backend(settings.embedding_backend),
+                    "ids": self._ids,
+                    "payloads": [self.metadata[doc_id] for doc_id in self._ids]
+                }, f)
+        except Exception as e:
+            print(f"Could not persist fallback index: {e}")
+    
+    def _load_fallback_index(self) -> bool:
+        """Restore a persisted fallback index built with the current embedding model and backend"""
+        if not FAISS_AVAILABLE or not os.path.exists(self._fallback_meta_path()):
+            return False
+        try:
+            with open(self._fallback_meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+            # Backends truncate and quantize differently, so their vectors aren't interchangeable
+            if (meta.get("embedding_model") != settings.embedding_model
+                    or meta.get("embedding_backend") != _effective_backend(settings.embedding_backend)):
+                return False
+            index = faiss.read_index(settings.fallback_index_path)
+            if index.ntotal != len(meta["ids"]):
+                return False
+        except Exception as e:
+            print(f"Could not load fallback index: {e}")
+            return False
         
-        for doc_id, vector in self.vectors.items():
-            # Calculate cosine similarity
-            similarity = np.dot(query_embedding, vector) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(vector)
-            )
-            
-            if similarity >= score_threshold:
-                results.append({
-                    "id": doc_id,
-                    "score": float(similarity),
-                    "content": self.metadata[doc_id]
-                })
+        self._index = index
+        self._ids = meta["ids"]
+        self.metadata = dict(zip(self._ids, meta["payloads"]))
+        print(f"Loaded fallback index with {index.ntotal} documents")
+        return True
+    
+    def _fallback_matches(self, documents: Iterable[Dict[str, Any]]) -> bool:
+        """Whether the loaded fallback index already holds exactly these documents
+        
+        Documents are only read when a fallback index is active, and are compared
+        one at a time so the dataset is never materialized.
+        """
+        if self.answers_collection is not None or getattr(self, '_index', None) is None:
+            return False
+        missing = object()
+        stored = (self.metadata[doc_id] for doc_id in self._ids)
+        for doc, payload in zip_longest(documents, stored, fillvalue=missing):
+            if doc is missing or payload is missing:
+                return False
+            # JSON round trip so tuples compare equal to the lists loaded from disk
+            if json.loads(json.dumps(self._payload(doc))) != payload:
+                return False
+        return True
+    
+    def _fallback_scores(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a normalized query against every fallback row"""
+        if self._vec_i8 is None:
+            # Rows are L2-normalized at insert, so one matmul yields every cosine similarity
+            return self._vec_matrix @ query_embedding
         
-        # Sort by score and return top results
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:limit]
+        # int8 scan with int32 accumulation, rescaled by the row and query scales
+        query_i8 = np.round(query_embedding * 127).astype(np.int8)
+        dots = np.matmul(self._vec_i8, query_i8, dtype=np.int32)
+        return dots.astype(np.float32) * self._row_scale * (1 / 127)
     
     def populate_knowledge_base(self):
         """Populate the knowledge base with mathematical problems"""
         dataset = MathDataset()
-        documents = dataset.to_dict()
-        self.add_documents(documents)
-        print(f"Knowledge base populated with {len(documents)} mathematical problems")
+        if self._fallback_matches(dataset.iter_dicts()):
+            print(f"Knowledge base already populated with {len(self._ids)} mathematical problems")
+            return
+        documents = dataset.iter_dicts()
+        
+        # Encode and upload in fixed-size chunks so peak memory stays O(chunk).
+        # Each chunk is a single upload batch, so no process pool is started; only
+        # the last upload waits, which makes the whole collection searchable on return
+        total = 0
+        chunk = list(islice(documents, POPULATE_CHUNK_SIZE))
+        while chunk:
+            next_chunk = list(islice(documents, POPULATE_CHUNK_SIZE))
+            self.add_documents(chunk, start_id=total, parallel=1, wait=not next_chunk)
+            total += len(chunk)
+            chunk = next_chunk
+        
+        self._persist_fallback_index()
+        print(f"Knowledge base populated with {total} mathematical problems")
+    
+    async def close(self):
+        """Close the async Qdrant client"""
+        await self.async_client.close()
     
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection"""
@@ -1,6 +1,180 @@
-import google.generativeai as genai
-from typing import Optional, Dict, Any
+import asyncio
+import json
+import re
+import time
+from datetime import timedelta
+from functools import cached_property, lru_cache
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
 from config import settings
+from llm.response_cache import ResponseCache
+
+try:
+    from llmlingua import PromptCompressor
+    LLMLINGUA_AVAILABLE = True
+except ImportError:
+    LLMLINGUA_AVAILABLE = False
+    print("Warning: llmlingua not available, retrieved context is sent uncompressed")
+
+COMPRESSION_MODEL = "microsoft/llmlingua-2-bert-base-multilingual-cased-meetingbank"
+CONTEXT_COMPRESSION_THRESHOLD = 500  # characters
+
+# Response cache lifetimes in seconds
+RESPONSE_CACHE_TTL = 24 * 3600
+QUERY_CACHE_TTL = 24 * 3600
+EVALUATION_CACHE_TTL = 3600
+PREFIX_CACHE_TTL = 3600
+
+# Static instructions are sent as system prompts so every request to a task shares
+# one stable prefix (explicitly cached when possible, implicitly cached otherwise)
+SYSTEM_MATH_PROMPT = """
+You are an expert mathematics professor. Please solve the mathematical question you are given step by step.
+
+Instructions:
+1. Provide a clear, step-by-step solution
+2. Explain each step in detail
+3. Use proper mathematical notation
+4. Include the final answer clearly marked
+5. If the problem involves multiple concepts, explain how they relate
+6. Be educational and help the student understand the process
+"""
+
+SYSTEM_EVALUATION_PROMPT = """
+Evaluate the quality of the mathematical response you are given.
+
+Rate the following aspects on a scale of 0-1:
+1. Accuracy: Is the mathematical solution correct?
+2. Clarity: Is the explanation clear and easy to follow?
+3. Completeness: Does it address all parts of the question?
+4. Educational Value: Does it help the student learn?
+
+Reply with a single JSON object with the fields accuracy, clarity, completeness,
+educational_value and overall (each a score from 0 to 1), and explanation
+(a brief explanation of your evaluation).
+"""
+
+SYSTEM_QUERY_PROMPT = """
+Convert the mathematical question you are given into an optimized web search query.
+
+Requirements:
+1. Include key mathematical terms
+2. Add "step by step solution" or "tutorial"
+3. Include the mathematical topic (algebra, calculus, etc.)
+4. Keep it concise but comprehensive
+5. Use terms that would appear in educational math websites
+"""
+
+SYSTEM_STEPS_PROMPT = """
+Extract the step-by-step solution from the mathematical response you are given.
+
+Please extract each step and format them as a numbered list. Each step should be clear and concise.
+"""
+
+SYSTEM_ANSWER_PROMPT = """
+Extract the final answer from the mathematical response you are given.
+
+Look for:
+- "Answer:", "Final answer:", "Solution:", "Result:"
+- The final numerical or algebraic result
+- The conclusion of the problem
+"""
+
+SYSTEM_PARSE_PROMPT = """
+Extract the step-by-step solution and the final answer from the mathematical response you are given.
+
+Please format each step as a numbered list, then give the final answer on its own line.
+
+Steps:
+1. [step]
+2. [step]
+
+Final answer: [answer]
+"""
+
+_EVALUATION_METRICS = ("accuracy", "clarity", "completeness", "educational_value", "overall")
+
+# Structured output for evaluations, parsed with a single json.loads
+_EVALUATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        **{metric: {"type": "NUMBER"} for metric in _EVALUATION_METRICS},
+        "explanation": {"type": "STRING"}
+    },
+    "required": [*_EVALUATION_METRICS, "explanation"]
+}
+_EVALUATION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": _EVALUATION_SCHEMA
+}
+
+# Local extraction of steps and the final answer; Gemini is only asked when these find nothing
+# Markdown emphasis (**bold**, __bold__, *em*, _em_) is stripped before matching; the guards
+# keep multiplication such as 2*3*4 and subscripts such as x_1 intact
+_EMPHASIS_PATTERN = re.compile(
+    r"\*\*(.+?)\*\*|__(.+?)__|(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?![\w*])|(?<![\w_])_(?=\S)([^_\n]+?)(?<=\S)_(?![\w_])"
+)
+_LOCAL_STEP_PATTERN = re.compile(
+    r"^[ \t#>]*(?:\d+[.)]|Step\s+\d+\s*[:.)\-])[ \t]*(\S.*)", re.MULTILINE | re.IGNORECASE
+)
+_LOCAL_BULLET_PATTERN = re.compile(r"^[ \t]*[-*+][ \t]+(\S.*)", re.MULTILINE)
+_LOCAL_ANSWER_PATTERN = re.compile(r"(?:final answer|answer|result)\s*[:=]\s*(.+?)(?:\n|$)", re.IGNORECASE)
+_LEADING_MARKUP = re.compile(r"^[\s*_#>:=\-]+")
+_TRAILING_MARKUP = re.compile(r"[\s*_]+$")
+_HAS_CONTENT = re.compile(r"[^\W_]")
+LOCAL_ANSWER_WINDOW = 500  # trailing characters scanned for the final answer
+LOCAL_ANSWER_MAX_LENGTH = 300  # longer captures are a paragraph, not an answer
+
+# Line prefixes stripped from the steps Gemini returns, applied in this order
+_STEP_NUMBER_PREFIX = re.compile(r'^\d+\.?\s*')
+_STEP_LABEL_PREFIX = re.compile(r'^Step\s+\d+[:\-]?\s*')
+_STEP_BULLET_PREFIX = re.compile(r'^-\s*')
+_FINAL_ANSWER_LINE = re.compile(r'^final answer[:\-]?\s*(.*)', re.IGNORECASE)
+
+# Structured output for solve_and_annotate: solution, steps, answer and a self-evaluation in one reply
+_SOLUTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "solution": {"type": "STRING"},
+        "steps": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "final_answer": {"type": "STRING"},
+        "self_evaluation": {
+            "type": "OBJECT",
+            "properties": {metric: {"type": "NUMBER"} for metric in _EVALUATION_METRICS}
+        }
+    },
+    "required": ["solution", "steps", "final_answer"]
+}
+_SOLUTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": _SOLUTION_SCHEMA
+}
+# Errors raised while reading a structured solution reply that doesn't fit the schema
+_MALFORMED_SOLUTION = (ValueError, TypeError, KeyError, AttributeError)
+
+@lru_cache(maxsize=None)
+def _genai():
+    """Import and configure the Gemini SDK on first use; it is slow to import"""
+    import google.generativeai as genai
+    genai.configure(api_key=settings.gemini_api_key)
+    return genai
+
+@lru_cache(maxsize=None)
+def _get_prompt_compressor():
+    """Load the LLMLingua-2 compressor once per process"""
+    return PromptCompressor(COMPRESSION_MODEL, use_llmlingua2=True, device_map="cpu")
+
+@lru_cache(maxsize=256)
+def _compress_context(context: str) -> str:
+    """Shorten long retrieved context before it is sent to Gemini"""
+    if not LLMLINGUA_AVAILABLE or len(context) <= CONTEXT_COMPRESSION_THRESHOLD:
+        return context
+    try:
+        compressed = _get_prompt_compressor().compress_prompt(
+            context, rate=0.5, force_tokens=['\n', '.', ',', '=']
+        )
+        return compressed["compressed_prompt"]
+    except Exception as e:
+        print(f"Context compression failed: {e}")
+        return context
 
 class GeminiClient:
     """Google Gemini AI client for mathematical problem solving"""
@@ -10,20 +184,102 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model_name = 'gemini-2.5-flash'
+        self.response_cache = ResponseCache(settings.gemini_cache_dir)
+        # System prompt -> (model, expiry timestamp or None when the model never expires)
+        self._prefix_models: Dict[str, Tuple[Any, Optional[float]]] = {}
+    
+    @cached_property
+    def model(self):
+        return _genai().GenerativeModel(self.model_name)
+    
+    def _ready_model(self, system_prompt: Optional[str]):
+        """Already-built model for a system prompt, or None if it must be (re)created"""
+        if system_prompt is None:
+            return self.__dict__.get("model")
+        
+        entry = self._prefix_models.get(system_prompt)
+        if entry is None or (entry[1] is not None and time.time() >= entry[1]):
+            return None
+        return entry[0]
+    
+    def _model_for(self, system_prompt: Optional[str]):
+        """Model whose requests start with the given system prompt"""
+        if system_prompt is None:
+            return self.model
+        model = self._ready_model(system_prompt)
+        if model is None:
+            entry = self._create_prefix_model(system_prompt)
+            self._prefix_models[system_prompt] = entry
+            model = entry[0]
+        return model
+    
+    def _create_prefix_model(self, system_prompt: str) -> Tuple[Any, Optional[float]]:
+        """Build a model on an explicit context cache, or on a plain system instruction"""
+        try:
+            cached_content = _genai().caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=system_prompt,
+                ttl=timedelta(seconds=PREFIX_CACHE_TTL)
+            )
+            model = _genai().GenerativeModel.from_cached_content(cached_content=cached_content)
+            # Recreate slightly before the server-side cache expires
+            return model, time.time() + PREFIX_CACHE_TTL - 60
+        except Exception:
+            # Explicit caches require a minimum prompt size; a stable system
+            # instruction still benefits from Gemini's implicit prefix caching
+            return _genai().GenerativeModel(self.model_name, system_instruction=system_prompt), None
+    
+    async def _acompress_context(self, context: str) -> str:
+        """Compress context in a worker thread; short context is returned as-is"""
+        if not LLMLINGUA_AVAILABLE or len(context) <= CONTEXT_COMPRESSION_THRESHOLD:
+            return context
+        return await asyncio.to_thread(_compress_context, context)
+    
+    def _cache_key(self, prompt: str, system_prompt: Optional[str]) -> str:
+        return ResponseCache.make_key(f"{system_prompt or ''}\x00{prompt}", self.model_name)
+    
+    def _generate_text(self, prompt: str, ttl: float,
+                       generation_config: Optional[Dict[str, Any]] = None,
+                       system_prompt: Optional[str] = None) -> Tuple[str, bool]:
+        """Generate text for a prompt, serving repeats from the response cache"""
+        key = self._cache_key(prompt, system_prompt)
+        cached = self.response_cache.get(key, ttl)
+        if cached is not None:
+            return cached, True
+        
+        model = self._model_for(system_prompt)
+        text = model.generate_content(prompt, generation_config=generation_config).text
+        self.response_cache.set(key, text, ttl)
+        return text, False
+    
+    async def _agenerate_text(self, prompt: str, ttl: float,
+                              generation_config: Optional[Dict[str, Any]] = None,
+                              system_prompt: Optional[str] = None) -> Tuple[str, bool]:
+        """Async variant of _generate_text"""
+        key = self._cache_key(prompt, system_prompt)
+        cached = await self.response_cache.aget(key, ttl)
+        if cached is not None:
+            return cached, True
+        
+        # Creating an explicit context cache is a blocking API call
+        model = self._ready_model(system_prompt) or await asyncio.to_thread(self._model_for, system_prompt)
+        text = (await model.generate_content_async(prompt, generation_config=generation_config)).text
+        await self.response_cache.aset(key, text, ttl)
+        return text, False
     
     def generate_math_response(self, question: str, context: str = "") -> Dict[str, Any]:
         """Generate a mathematical response using Gemini"""
         try:
-            prompt = self._create_math_prompt(question, context)
-            response = self.model.generate_content(prompt)
+            prompt = self._create_math_prompt(question, _compress_context(context))
+            text, cache_hit = self._generate_text(prompt, RESPONSE_CACHE_TTL, system_prompt=SYSTEM_MATH_PROMPT)
             
             return {
                 "success": True,
-                "response": response.text,
+                "response": text,
                 "model": "gemini-pro",
-                "confidence": 0.8  # Gemini doesn't provide confidence scores
+                "confidence": 0.8,  # Gemini doesn't provide confidence scores
+                "cache_hit": cache_hit
             }
             
         except Exception as e:
@@ -33,92 +289,180 @@ class GeminiClient:
                 "model": "gemini-pro"
             }
     
-    def _create_math_prompt(self, question: str, context: str = "") -> str:
-        """Create a specialized prompt for mathematical problem solving"""
-        base_prompt = f"""
-You are an expert mathematics professor. Please solve the following mathematical question step by step.
-
+    async def agenerate_math_response(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Async variant of generate_math_response that doesn't block the event loop"""
+        try:
+            prompt = self._create_math_prompt(question, await self._acompress_context(context))
+            text, cache_hit = await self._agenerate_text(prompt, RESPONSE_CACHE_TTL, system_prompt=SYSTEM_MATH_PROMPT)
+            
+            return {
+                "success": True,
+                "response": text,
+                "model": "gemini-pro",
+                "confidence": 0.8,  # Gemini doesn't provide confidence scores
+                "cache_hit": cache_hit
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "model": "gemini-pro"
+            }
+    
+    async def agenerate_math_response_stream(self, question: str, context: str = "") -> AsyncIterator[str]:
+        """Yield the response text of agenerate_math_response as Gemini produces it
+        
+        The assembled text is cached under the same key, so a repeat is served in one chunk.
+        """
+        prompt = self._create_math_prompt(question, await self._acompress_context(context))
+        key = self._cache_key(prompt, SYSTEM_MATH_PROMPT)
+        cached = await self.response_cache.aget(key, RESPONSE_CACHE_TTL)
+        if cached is not None:
+            yield cached
+            return
+        
+        model = self._ready_model(SYSTEM_MATH_PROMPT) or await asyncio.to_thread(self._model_for, SYSTEM_MATH_PROMPT)
+        chunks = []
+        async for chunk in await model.generate_content_async(prompt, stream=True):
+            chunks.append(chunk.text)
+            yield chunk.text
+        await self.response_cache.aset(key, "".join(chunks), RESPONSE_CACHE_TTL)
+    
+    def solve_and_annotate(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Solve a question and return steps, final answer and self-evaluation from one request"""
+        prompt = self._create_solution_prompt(question, _compress_context(context))
+        try:
+            text, cache_hit = self._generate_text(
+                prompt, RESPONSE_CACHE_TTL, _SOLUTION_GENERATION_CONFIG, SYSTEM_MATH_PROMPT
+            )
+            return self._parse_solution(text, cache_hit)
+        except Exception as e:
+            if isinstance(e, _MALFORMED_SOLUTION):
+                # Evict the malformed reply so the next attempt asks Gemini again
+                self.response_cache.delete(self._cache_key(prompt, SYSTEM_MATH_PROMPT))
+            return {
+                "success": False,
+                "error": str(e),
+                "model": "gemini-pro"
+            }
+    
+    async def asolve_and_annotate(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Async variant of solve_and_annotate that doesn't block the event loop"""
+        prompt = self._create_solution_prompt(question, await self._acompress_context(context))
+        try:
+            text, cache_hit = await self._agenerate_text(
+                prompt, RESPONSE_CACHE_TTL, _SOLUTION_GENERATION_CONFIG, SYSTEM_MATH_PROMPT
+            )
+            return self._parse_solution(text, cache_hit)
+        except Exception as e:
+            if isinstance(e, _MALFORMED_SOLUTION):
+                # Evict the malformed reply so the next attempt asks Gemini again
+                await self.response_cache.adelete(self._cache_key(prompt, SYSTEM_MATH_PROMPT))
+            return {
+                "success": False,
+                "error": str(e),
+                "model": "gemini-pro"
+            }
+    
+    def _create_solution_prompt(self, question: str, context: str = "") -> str:
+        """Math prompt extended with the structured reply format used by solve_and_annotate"""
+        return self._create_math_prompt(question, context) + """
+Reply with a single JSON object with these fields:
+- "solution": the complete worked solution and explanation
+- "steps": the solution steps, one string per step
+- "final_answer": only the final answer
+- "self_evaluation": your 0-1 scores for accuracy, clarity, completeness, educational_value and overall
+"""
+    
+    def _parse_solution(self, text: str, cache_hit: bool) -> Dict[str, Any]:
+        """Validate a structured solution reply, raising one of _MALFORMED_SOLUTION if it is malformed"""
+        data = json.loads(text)
+        steps = [str(step).strip() for step in data["steps"] if str(step).strip()]
+        solution = str(data["solution"]).strip()
+        final_answer = str(data["final_answer"]).strip()
+        evaluation = data.get("self_evaluation") or {}
+        self_evaluation = {metric: float(evaluation.get(metric, 0.5)) for metric in _EVALUATION_METRICS}
+        
+        return {
+            "success": True,
+            "solution": solution,
+            "steps": steps if steps else ["Solution steps not clearly identified"],
+            "final_answer": final_answer if final_answer else "Final answer not clearly identified",
+            "self_evaluation": self_evaluation,
+            "model": "gemini-pro",
+            "confidence": 0.8,  # Gemini doesn't provide confidence scores
+            "cache_hit": cache_hit
+        }
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _create_math_prompt(question: str, context: str = "") -> str:
+        """Create the question-specific part of the math prompt (instructions live in SYSTEM_MATH_PROMPT)"""
+        return f"""
 Question: {question}
 
-Instructions:
-1. Provide a clear, step-by-step solution
-2. Explain each step in detail
-3. Use proper mathematical notation
-4. Include the final answer clearly marked
-5. If the problem involves multiple concepts, explain how they relate
-6. Be educational and help the student understand the process
-
 {context if context else ""}
 
 Please provide your solution:
 """
-        return base_prompt
     
     def evaluate_response_quality(self, question: str, response: str) -> Dict[str, Any]:
         """Evaluate the quality of a mathematical response"""
         try:
-            prompt = f"""
-Evaluate the quality of this mathematical response:
-
-Question: {question}
-Response: {response}
-
-Rate the following aspects on a scale of 0-1:
-1. Accuracy: Is the mathematical solution correct?
-2. Clarity: Is the explanation clear and easy to follow?
-3. Completeness: Does it address all parts of the question?
-4. Educational Value: Does it help the student learn?
-
-Provide your evaluation in this format:
-Accuracy: [score]
-Clarity: [score]
-Completeness: [score]
-Educational Value: [score]
-Overall: [score]
-
-Explanation: [brief explanation of your evaluation]
-"""
+            prompt = self._create_evaluation_prompt(question, response)
+            evaluation_text, cache_hit = self._generate_text(
+                prompt, EVALUATION_CACHE_TTL, _EVALUATION_GENERATION_CONFIG, SYSTEM_EVALUATION_PROMPT
+            )
+            evaluation = self._parse_evaluation(evaluation_text)
+            evaluation["cache_hit"] = cache_hit
+            return evaluation
             
-            evaluation_response = self.model.generate_content(prompt)
-            return self._parse_evaluation(evaluation_response.text)
+        except Exception as e:
+            return self._failed_evaluation(e)
+    
+    async def aevaluate_response_quality(self, question: str, response: str) -> Dict[str, Any]:
+        """Async variant of evaluate_response_quality that doesn't block the event loop"""
+        try:
+            prompt = self._create_evaluation_prompt(question, response)
+            evaluation_text, cache_hit = await self._agenerate_text(
+                prompt, EVALUATION_CACHE_TTL, _EVALUATION_GENERATION_CONFIG, SYSTEM_EVALUATION_PROMPT
+            )
+            evaluation = self._parse_evaluation(evaluation_text)
+            evaluation["cache_hit"] = cache_hit
+            return evaluation
             
         except Exception as e:
-            return {
-                "accuracy": 0.5,
-                "clarity": 0.5,
-                "completeness": 0.5,
-                "educational_value": 0.5,
-                "overall": 0.5,
-                "explanation": f"Evaluation failed: {str(e)}"
-            }
+            return self._failed_evaluation(e)
     
-    def _parse_evaluation(self, evaluation_text: str) -> Dict[str, Any]:
-        """Parse the evaluation response from Gemini"""
-        import re
-        
-        scores = {
+    def _create_evaluation_prompt(self, question: str, response: str) -> str:
+        """Create the response-specific part of the evaluation prompt"""
+        return f"""
+Question: {question}
+Response: {response}
+"""
+    
+    def _failed_evaluation(self, error: Exception) -> Dict[str, Any]:
+        """Neutral scores returned when evaluation fails"""
+        return {
             "accuracy": 0.5,
             "clarity": 0.5,
             "completeness": 0.5,
             "educational_value": 0.5,
             "overall": 0.5,
-            "explanation": "Evaluation parsing failed"
+            "explanation": f"Evaluation failed: {str(error)}"
         }
+    
+    def _parse_evaluation(self, evaluation_text: str) -> Dict[str, Any]:
+        """Parse the JSON evaluation returned by Gemini"""
+        scores = {metric: 0.5 for metric in _EVALUATION_METRICS}
         
         try:
-            # Extract scores using regex
-            for metric in ["accuracy", "clarity", "completeness", "educational_value", "overall"]:
-                pattern = rf"{metric}:\s*([0-9.]+)"
-                match = re.search(pattern, evaluation_text, re.IGNORECASE)
-                if match:
-                    scores[metric] = float(match.group(1))
-            
-            # Extract explanation
-            explanation_match = re.search(r"explanation:\s*(.+)", evaluation_text, re.IGNORECASE | re.DOTALL)
-            if explanation_match:
-                scores["explanation"] = explanation_match.group(1).strip()
-            
-        except Exception as e:
+            data = json.loads(evaluation_text)
+            for metric in _EVALUATION_METRICS:
+                scores[metric] = float(data.get(metric, 0.5))
+            scores["explanation"] = str(data.get("explanation", "")).strip()
+        except (ValueError, TypeError, AttributeError) as e:
             scores["explanation"] = f"Error parsing evaluation: {str(e)}"
         
         return scores
@@ -127,22 +471,13 @@ Explanation: [brief explanation of your evaluation]
         """Generate an optimized search query for web search"""
         try:
             prompt = f"""
-Convert this mathematical question into an optimized web search query:
-
 Question: {question}
 
-Requirements:
-1. Include key mathematical terms
-2. Add "step by step solution" or "tutorial"
-3. Include the mathematical topic (algebra, calculus, etc.)
-4. Keep it concise but comprehensive
-5. Use terms that would appear in educational math websites
-
 Search query:
 """
             
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            text, _ = self._generate_text(prompt, QUERY_CACHE_TTL, system_prompt=SYSTEM_QUERY_PROMPT)
+            return text.strip()
             
         except Exception as e:
             # Fallback to simple enhancement
@@ -150,57 +485,171 @@ Search query:
     
     def extract_solution_steps(self, response: str) -> list:
         """Extract solution steps from a mathematical response"""
-        import re
-        
+        steps = self._local_extract_steps(response)
+        if steps:
+            return steps
         try:
-            prompt = f"""
-Extract the step-by-step solution from this mathematical response:
-
+            steps_text, _ = self._generate_text(
+                self._create_steps_prompt(response), RESPONSE_CACHE_TTL, system_prompt=SYSTEM_STEPS_PROMPT
+            )
+            return self._parse_steps(steps_text)
+            
+        except Exception as e:
+            return ["Error extracting steps: " + str(e)]
+    
+    def _create_steps_prompt(self, response: str) -> str:
+        """Create the response-specific part of the steps prompt"""
+        return f"""
 Response: {response}
 
-Please extract each step and format them as a numbered list. Each step should be clear and concise.
-
 Steps:
 """
-            
-            steps_response = self.model.generate_content(prompt)
-            steps_text = steps_response.text.strip()
-            
-            # Parse steps from the response
-            steps = []
-            for line in steps_text.split('\n'):
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('Step') or line.startswith('-')):
-                    # Clean up the step
-                    step = re.sub(r'^\d+\.?\s*', '', line)
-                    step = re.sub(r'^Step\s+\d+[:\-]?\s*', '', step)
-                    step = re.sub(r'^-\s*', '', step)
-                    if step:
-                        steps.append(step)
-            
-            return steps if steps else ["Solution steps not clearly identified"]
-            
-        except Exception as e:
-            return ["Error extracting steps: " + str(e)]
+    
+    @staticmethod
+    def _strip_emphasis(text: str) -> str:
+        return _EMPHASIS_PATTERN.sub(lambda match: next(group for group in match.groups() if group), text)
+    
+    @staticmethod
+    def _clean_fragment(text: str) -> str:
+        return _TRAILING_MARKUP.sub("", _LEADING_MARKUP.sub("", text))
+    
+    @staticmethod
+    def _local_extract_steps(text: str) -> List[str]:
+        """Pick numbered or "Step N" lines straight out of a response
+        
+        Plain bullets are only used when there are no numbered lines, since
+        Gemini nests them under steps for details. Returns [] when nothing
+        usable is found so callers fall back to Gemini.
+        """
+        text = GeminiClient._strip_emphasis(text)
+        matches = _LOCAL_STEP_PATTERN.findall(text) or _LOCAL_BULLET_PATTERN.findall(text)
+        steps = [GeminiClient._clean_fragment(step) for step in matches]
+        if not steps or not all(_HAS_CONTENT.search(step) for step in steps):
+            return []
+        return steps
+    
+    @staticmethod
+    def _local_extract_answer(text: str) -> str:
+        """Return the last "final answer/answer/result:" value near the end of a response
+        
+        Returns "" when nothing plausible is found so callers fall back to Gemini.
+        """
+        text = GeminiClient._strip_emphasis(text[-LOCAL_ANSWER_WINDOW:])
+        matches = _LOCAL_ANSWER_PATTERN.findall(text)
+        answer = GeminiClient._clean_fragment(matches[-1]) if matches else ""
+        if not _HAS_CONTENT.search(answer) or len(answer) > LOCAL_ANSWER_MAX_LENGTH:
+            return ""
+        return answer
+    
+    @staticmethod
+    def _clean_step(line: str) -> str:
+        """Strip the number, "Step N" label or bullet from a step line"""
+        step = _STEP_NUMBER_PREFIX.sub('', line)
+        step = _STEP_LABEL_PREFIX.sub('', step)
+        return _STEP_BULLET_PREFIX.sub('', step)
+    
+    def _parse_steps(self, steps_text: str) -> List[str]:
+        """Parse numbered, "Step N" or bulleted lines into solution steps"""
+        steps = []
+        for line in steps_text.strip().split('\n'):
+            line = line.strip()
+            if line and (line[0].isdigit() or line.startswith('Step') or line.startswith('-')):
+                step = self._clean_step(line)
+                if step:
+                    steps.append(step)
+        
+        return steps if steps else ["Solution steps not clearly identified"]
     
     def extract_final_answer(self, response: str) -> str:
         """Extract the final answer from a mathematical response"""
+        answer = self._local_extract_answer(response)
+        if answer:
+            return answer
         try:
-            prompt = f"""
-Extract the final answer from this mathematical response:
-
+            answer_text, _ = self._generate_text(
+                self._create_answer_prompt(response), RESPONSE_CACHE_TTL, system_prompt=SYSTEM_ANSWER_PROMPT
+            )
+            return answer_text.strip()
+            
+        except Exception as e:
+            return "Final answer not clearly identified"
+    
+    def _create_answer_prompt(self, response: str) -> str:
+        """Create the response-specific part of the final-answer prompt"""
+        return f"""
 Response: {response}
 
-Look for:
-- "Answer:", "Final answer:", "Solution:", "Result:"
-- The final numerical or algebraic result
-- The conclusion of the problem
-
 Final answer:
 """
+    
+    def parse_gemini_response(self, response: str) -> Tuple[List[str], str]:
+        """Extract solution steps and final answer from a response in one pass"""
+        steps, final_answer = self._local_extract_steps(response), self._local_extract_answer(response)
+        if steps and final_answer:
+            return steps, final_answer
+        try:
+            parsed_text, _ = self._generate_text(
+                self._create_parse_prompt(response), RESPONSE_CACHE_TTL, system_prompt=SYSTEM_PARSE_PROMPT
+            )
+            parsed_steps, parsed_answer = self._parse_steps_and_answer(parsed_text)
+            return steps or parsed_steps, final_answer or parsed_answer
             
-            answer_response = self.model.generate_content(prompt)
-            return answer_response.text.strip()
+        except Exception as e:
+            return ["Error extracting steps: " + str(e)], "Final answer not clearly identified"
+    
+    async def aparse_gemini_response(self, response: str) -> Tuple[List[str], str]:
+        """Async variant of parse_gemini_response that doesn't block the event loop"""
+        steps, final_answer = self._local_extract_steps(response), self._local_extract_answer(response)
+        if steps and final_answer:
+            return steps, final_answer
+        try:
+            parsed_text, _ = await self._agenerate_text(
+                self._create_parse_prompt(response), RESPONSE_CACHE_TTL, system_prompt=SYSTEM_PARSE_PROMPT
+            )
+            parsed_steps, parsed_answer = self._parse_steps_and_answer(parsed_text)
+            return steps or parsed_steps, final_answer or parsed_answer
             
         except Exception as e:
-            return "Final answer not clearly identified"
+            return ["Error extracting steps: " + str(e)], "Final answer not clearly identified"
+    
+    def _create_parse_prompt(self, response: str) -> str:
+        """Create the response-specific part of the steps-and-answer prompt"""
+        return f"""
+Response: {response}
+"""
+    
+    def _parse_steps_and_answer(self, parsed_text: str) -> Tuple[List[str], str]:
+        """Parse steps and the final answer in a single sweep of the lines"""
+        steps = []
+        final_answer = ""
+        for line in parsed_text.strip().split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            answer_match = _FINAL_ANSWER_LINE.match(line)
+            if answer_match:
+                final_answer = answer_match.group(1).strip()
+            elif line[0].isdigit() or line.startswith('Step') or line.startswith('-'):
+                step = self._clean_step(line)
+                if step:
+                    steps.append(step)
+        
+        return (
+            steps if steps else ["Solution steps not clearly identified"],
+            final_answer if final_answer else "Final answer not clearly identified"
+        )
+    
+    def close(self):
+        """Release the response cache"""
+        self.response_cache.close()
+
+@lru_cache(maxsize=1)
+def get_gemini() -> GeminiClient:
+    """Process-wide GeminiClient, so the SDK, models and caches are set up once"""
+    return GeminiClient()
+
+def close_gemini():
+    """Close the shared client, if one was created; get_gemini() builds a fresh one afterwards"""
+    if get_gemini.cache_info().currsize:
+        get_gemini().close()
+    get_gemini.cache_clear()
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+    print("Warning: diskcache not available, Gemini responses are cached in memory only")
+
+class ResponseCache:
+    """In-memory LRU backed by an optional disk cache for Gemini response texts"""
+
+    def __init__(self, directory: str, max_memory_entries: int = 1024):
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if DISKCACHE_AVAILABLE:
+            try:
+                self._disk = diskcache.Cache(directory)
+            except Exception as e:
+                print(f"Could not open Gemini disk cache: {e}")
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: Optional[float] = None) -> str:
+        """Deterministic key for a prompt sent to a given model configuration"""
+        return hashlib.sha256(f"{model}\x00{temperature}\x00{prompt}".encode()).hexdigest()
+
+    def get(self, key: str, ttl: float) -> Optional[str]:
+        """Return the cached text if it is younger than ttl seconds"""
+        text = self._get_memory(key, ttl)
+        if text is None and self._disk is not None:
+            text = self._get_disk(key, ttl)
+        return text
+
+    async def aget(self, key: str, ttl: float) -> Optional[str]:
+        """Async variant of get; the disk lookup runs in a worker thread"""
+        text = self._get_memory(key, ttl)
+        if text is None and self._disk is not None:
+            text = await asyncio.to_thread(self._get_disk, key, ttl)
+        return text
+
+    def set(self, key: str, text: str, ttl: float):
+        """Store a response text in memory and, when available, on disk"""
+        timestamp = time.time()
+        self._remember(key, text, timestamp)
+        if self._disk is not None:
+            self._set_disk(key, text, timestamp, ttl)
+
+    async def aset(self, key: str, text: str, ttl: float):
+        """Async variant of set; the disk write runs in a worker thread"""
+        timestamp = time.time()
+        self._remember(key, text, timestamp)
+        if self._disk is not None:
+            await asyncio.to_thread(self._set_disk, key, text, timestamp, ttl)
+
+    def delete(self, key: str):
+        """Drop an entry from both cache levels"""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(key)
+
+    async def adelete(self, key: str):
+        """Async variant of delete; the disk delete runs in a worker thread"""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.delete, key)
+
+    def _get_memory(self, key: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            text, timestamp = entry
+            if now - timestamp <= ttl:
+                self._memory.move_to_end(key)
+                return text
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key: str, ttl: float) -> Optional[str]:
+        # diskcache reads hit SQLite, so async callers run this off the event loop
+        entry = self._disk.get(key)
+        if not entry or time.time() - entry["timestamp"] > ttl:
+            return None
+        self._remember(key, entry["text"], entry["timestamp"])
+        return entry["text"]
+
+    def _set_disk(self, key: str, text: str, timestamp: float, ttl: float):
+        self._disk.set(key, {"text": text, "timestamp": timestamp}, expire=ttl)
+
+    def _remember(self, key: str, text: str, timestamp: float):
+        with self._lock:
+            self._memory[key] = (text, timestamp)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def close(self):
+        """Close the disk cache, if one was opened"""
+        if self._disk is not None:
+            self._disk.close()
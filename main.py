@@ -1,13 +1,27 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any
+import os
 import uvicorn
 import asyncio
+import hashlib
+import json
 from contextlib import asynccontextmanager
 
+try:
+    from fastapi_cache import FastAPICache
+    from fastapi_cache.backends.redis import RedisBackend
+    from redis import asyncio as aioredis
+    RESPONSE_CACHE_AVAILABLE = True
+except ImportError:
+    RESPONSE_CACHE_AVAILABLE = False
+    print("Warning: fastapi-cache2/redis not available, /ask responses will not be cached")
+
+from config import settings
 from agents.routing_agent import MathRoutingAgent
+from llm.gemini_client import close_gemini
 from knowledge_base.vector_store import VectorStore
 from feedback.dspy_feedback import MathLearningSystem
 
@@ -15,28 +29,70 @@ from feedback.dspy_feedback import MathLearningSystem
 routing_agent = None
 vector_store = None
 learning_system = None
+response_cache_enabled = False
+
+async def init_response_cache() -> bool:
+    """Connect the Redis-backed /ask response cache, if configured"""
+    if not (RESPONSE_CACHE_AVAILABLE and settings.redis_url):
+        return False
+    try:
+        redis = aioredis.from_url(settings.redis_url)
+        await redis.ping()
+        FastAPICache.init(RedisBackend(redis), prefix="mathrag")
+        return True
+    except Exception as e:
+        print(f"Could not connect to Redis, /ask responses will not be cached: {e}")
+        return False
+
+def _on_kb_populated(app: FastAPI, task: asyncio.Task):
+    """Mark the knowledge base ready once background population succeeds"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print(f"Error populating knowledge base: {error}")
+        return
+    app.state.kb_ready = True
+    print("Knowledge base ready")
+
+def _create_routing_agent() -> MathRoutingAgent:
+    """Routing agent with its lazily-built subsystems already constructed"""
+    agent = MathRoutingAgent()
+    agent.warm_up()
+    return agent
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global routing_agent, vector_store, learning_system
+    global routing_agent, vector_store, learning_system, response_cache_enabled
     
     # Startup
     print("Starting Math Routing Agent...")
-    routing_agent = MathRoutingAgent()
-    vector_store = VectorStore()
-    learning_system = MathLearningSystem()
+    response_cache_enabled = await init_response_cache()
+    # Constructors load models and SDKs, so build the agent off the event loop.
+    # The endpoints share its vector store and learning system, so there is one
+    # Qdrant client, one knowledge base and one feedback collector
+    routing_agent = await asyncio.to_thread(_create_routing_agent)
+    vector_store = routing_agent.vector_store
+    learning_system = routing_agent.learning_system
     
-    # Populate knowledge base
+    # Populate knowledge base in the background so the API accepts traffic
+    # immediately; /ask degrades to web search until the index is complete
     print("Populating knowledge base...")
-    vector_store.populate_knowledge_base()
+    app.state.kb_ready = False
+    app.state.kb_task = asyncio.create_task(asyncio.to_thread(vector_store.populate_knowledge_base))
+    app.state.kb_task.add_done_callback(lambda task: _on_kb_populated(app, task))
     
     yield
     
     # Shutdown
     print("Shutting down...")
+    if not app.state.kb_task.done():
+        app.state.kb_task.cancel()
+    # The agent also closes the shared vector store and feedback collector
     if routing_agent:
         await routing_agent.close()
+    close_gemini()
 
 app = FastAPI(
     title="Math Routing Agent API",
@@ -91,11 +147,47 @@ def get_vector_store() -> VectorStore:
         raise HTTPException(status_code=503, detail="Vector store not initialized")
     return vector_store
 
+def get_ready_vector_store(request: Request) -> VectorStore:
+    store = get_vector_store()
+    if not getattr(request.app.state, "kb_ready", False):
+        raise HTTPException(status_code=503, detail="Knowledge base is still loading")
+    return store
+
 def get_learning_system() -> MathLearningSystem:
     if learning_system is None:
         raise HTTPException(status_code=503, detail="Learning system not initialized")
     return learning_system
 
+# Response cache helpers
+def _is_learning_mode(user_id: Optional[str]) -> bool:
+    return bool(user_id) and user_id.startswith(settings.learning_mode_user_prefix)
+
+def _ask_cache_key(question: str) -> str:
+    digest = hashlib.sha256(question.encode()).hexdigest()
+    return f"{FastAPICache.get_prefix()}:ask:{digest}"
+
+async def _get_cached_response(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        cached = await FastAPICache.get_backend().get(key)
+        return json.loads(cached) if cached else None
+    except Exception as e:
+        print(f"Response cache read failed: {e}")
+        return None
+
+def _cacheable_payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer payload without the per-request session id and timestamp"""
+    response = {key: value for key, value in result["response"].items() if key not in ("session_id", "timestamp")}
+    payload = {key: value for key, value in result.items() if key != "session_id"}
+    payload["response"] = response
+    return payload
+
+async def _set_cached_response(key: str, result: Dict[str, Any]):
+    try:
+        payload = json.dumps(_cacheable_payload(result)).encode()
+        await FastAPICache.get_backend().set(key, payload, expire=settings.response_cache_ttl)
+    except Exception as e:
+        print(f"Response cache write failed: {e}")
+
 # API Endpoints
 @app.get("/")
 async def root():
@@ -114,6 +206,7 @@ async def health_check():
         "components": {
             "routing_agent": routing_agent is not None,
             "vector_store": vector_store is not None,
+            "knowledge_base_ready": getattr(app.state, "kb_ready", False),
             "learning_system": learning_system is not None
         }
     }
@@ -125,11 +218,45 @@ async def ask_math_question(
 ):
     """Ask a mathematical question"""
     try:
+        # Learning-mode users always get a fresh answer so their feedback
+        # is collected against what the pipeline produces now
+        use_cache = response_cache_enabled and not _is_learning_mode(request.user_id)
+        if use_cache:
+            cache_key = _ask_cache_key(request.question)
+            cached = await _get_cached_response(cache_key)
+            if cached is not None:
+                return MathQuestionResponse(**agent.replay_result(cached))
+        
         result = await agent.process_question(request.question, request.user_id)
-        return MathQuestionResponse(**result)
+        response = MathQuestionResponse(**result)
+        
+        # Failed or rejected questions are not cached
+        if use_cache and response.success:
+            await _set_cached_response(cache_key, result)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
+@app.post("/ask/stream")
+async def ask_math_question_stream(
+    request: MathQuestionRequest,
+    agent: MathRoutingAgent = Depends(get_routing_agent)
+):
+    """Ask a mathematical question, streaming the answer as server-sent events
+    
+    "token" events carry answer text as it is generated; a final "result"
+    event carries the same payload as /ask. An "error" event reports a
+    generation failure mid-stream; the result then comes from the search results.
+    """
+    return StreamingResponse(
+        _sse_events(agent.process_question_stream(request.question, request.user_id)),
+        media_type="text/event-stream"
+    )
+
+async def _sse_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
 @app.post("/feedback", response_model=FeedbackResponse)
 async def submit_feedback(
     request: FeedbackRequest,
@@ -172,7 +299,7 @@ async def get_knowledge_base_info(
 async def search_knowledge_base(
     query: str,
     limit: int = 5,
-    vector_store: VectorStore = Depends(get_vector_store)
+    vector_store: VectorStore = Depends(get_ready_vector_store)
 ):
     """Search the knowledge base directly"""
     try:
@@ -212,11 +339,12 @@ async def general_exception_handler(request, exc):
     )
 
 if __name__ == "__main__":
+    # Auto-reload is for local development only; use run_prod.py in production
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=os.getenv("ENV") == "dev",
         log_level="info"
     )
 
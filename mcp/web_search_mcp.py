@@ -1,37 +1,131 @@
 import asyncio
 import json
+import re
+import time
 from typing import Dict, List, Any, Optional
 import httpx
-from tavily import TavilyClient
 from config import settings
 
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    print("Warning: h2 not available, MCP requests will use HTTP/1.1")
+
+# One pooled client is shared by every request; HTTP/2 multiplexes them over few connections
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+# Upstream stalls fail fast instead of holding every /ask for the full timeout
+SEARCH_TIMEOUT = httpx.Timeout(5.0, connect=1.5)
+SEARCH_RETRY_ATTEMPTS = 3  # connection failures only; timeouts are not retried
+SEARCH_RETRY_BACKOFF = 0.1  # seconds, doubled after each attempt
+CIRCUIT_FAIL_MAX = 5
+CIRCUIT_RESET_TIMEOUT = 60  # seconds
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+MATH_SEARCH_DOMAINS = ["khanacademy.org", "mathworld.wolfram.com", "brilliant.org",
+                       "math.stackexchange.com", "purplemath.com", "mathisfun.com"]
+
+def _substring_pattern(keywords: List[str]):
+    """Case-insensitive alternation matching any keyword as a substring, like `keyword in text.lower()`"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+
+_MATH_QUERY_KEYWORDS = _substring_pattern([
+    "mathematics", "math", "algebra", "calculus", "geometry",
+    "trigonometry", "statistics", "step by step", "solution"
+])
+_MATH_CONTENT_INDICATORS = _substring_pattern([
+    "equation", "formula", "solve", "calculate", "derivative",
+    "integral", "algebra", "geometry", "trigonometry", "statistics",
+    "step", "solution", "answer", "mathematical", "math"
+])
+_SOLUTION_KEYWORDS = _substring_pattern(["step", "solution", "answer"])
+
+# Page chrome that Tavily snippets often carry along with the actual content
+# Only whole site-chrome phrases, so word problems about cookies or sign-ups survive
+_BOILERPLATE = re.compile(
+    r"\b(?:skip to (?:main )?content|we use cookies|accept (?:all )?cookies|cookie (?:policy|settings)|"
+    r"privacy policy|terms of (?:use|service)|all rights reserved|subscribe to our newsletter|"
+    r"sign up for free|log in to continue)\b|\u00a9",
+    re.IGNORECASE
+)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_NON_WORD = re.compile(r"\W+")
+EXPLANATION_CHARS_PER_RESULT = 800
+
+class CircuitBreaker:
+    """Opens after fail_max consecutive failures, skipping calls for reset_timeout seconds
+    
+    Once the timeout has passed the breaker is half-open: allow() admits exactly
+    one probe and rejects everything else until it records a result. A failed
+    probe reopens the circuit, a successful one closes it. A probe that never
+    reports back (e.g. its request was cancelled) is replaced after another
+    reset_timeout.
+    """
+    
+    def __init__(self, fail_max: int = CIRCUIT_FAIL_MAX, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+    
+    def allow(self) -> bool:
+        """Whether a call may go through now; claims the probe slot when half-open"""
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at < self.reset_timeout:
+            return False
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+    
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+    
+    def record_failure(self):
+        self._failures += 1
+        if self._probe_started is not None or self._failures >= self.fail_max:
+            self._opened_at = time.monotonic()
+        self._probe_started = None
+
 class WebSearchMCP:
     """Model Context Protocol implementation for web search"""
     
     def __init__(self):
-        self.tavily_client = TavilyClient(api_key=settings.tavily_api_key)
+        self.tavily_api_key = settings.tavily_api_key
         self.mcp_server_url = settings.mcp_server_url
-        self.session = httpx.AsyncClient(timeout=30.0)
+        self.session = httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=SEARCH_TIMEOUT, limits=HTTP_LIMITS)
+        self.tavily_breaker = CircuitBreaker()
+        self.mcp_breaker = CircuitBreaker()
     
-    async def search_math_content(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
-        """Search for mathematical content using Tavily API"""
+    async def search_math_content(self, query: str, max_results: int = 5,
+                                  strict_domain: bool = True) -> List[Dict[str, Any]]:
+        """Search for mathematical content using Tavily API
+        
+        With ``strict_domain`` Tavily only returns pages from the math sites in
+        MATH_SEARCH_DOMAINS, so results are not re-checked for math keywords.
+        """
+        if not self.tavily_breaker.allow():
+            return await self._fallback_search(query, max_results)
+        
         try:
             # Enhance query for mathematical content
             enhanced_query = self._enhance_math_query(query)
             
             # Perform search
-            search_results = self.tavily_client.search(
-                query=enhanced_query,
-                search_depth="advanced",
-                max_results=max_results,
-                include_domains=["khanacademy.org", "mathworld.wolfram.com", "brilliant.org", 
-                               "math.stackexchange.com", "purplemath.com", "mathisfun.com"]
-            )
+            search_results = await self._tavily_search(enhanced_query, max_results, strict_domain)
+            self.tavily_breaker.record_success()
             
             # Process and filter results
             processed_results = []
             for result in search_results.get("results", []):
-                if self._is_math_related(result.get("content", "")):
+                if strict_domain or self._is_math_related(result.get("content", "")):
                     processed_results.append({
                         "title": result.get("title", ""),
                         "url": result.get("url", ""),
@@ -44,53 +138,94 @@ class WebSearchMCP:
             
         except Exception as e:
             print(f"Error in Tavily search: {e}")
+            self.tavily_breaker.record_failure()
             return await self._fallback_search(query, max_results)
     
+    async def _tavily_search(self, query: str, max_results: int, strict_domain: bool = True) -> Dict[str, Any]:
+        """Query Tavily's REST API through the shared pooled client"""
+        payload = {
+            "query": query,
+            "search_depth": "advanced",
+            "max_results": max_results
+        }
+        if strict_domain:
+            payload["include_domains"] = MATH_SEARCH_DOMAINS
+        response = await self._post(
+            TAVILY_SEARCH_URL,
+            headers={"Authorization": f"Bearer {self.tavily_api_key}"},
+            json=payload
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    async def _post(self, url: str, **kwargs) -> httpx.Response:
+        """POST on the shared client, retrying refused connections with exponential backoff"""
+        for attempt in range(SEARCH_RETRY_ATTEMPTS):
+            try:
+                return await self.session.post(url, **kwargs)
+            except httpx.ConnectError:
+                if attempt == SEARCH_RETRY_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(SEARCH_RETRY_BACKOFF * 2 ** attempt)
+    
     def _enhance_math_query(self, query: str) -> str:
         """Enhance query for better mathematical search results"""
-        math_keywords = [
-            "mathematics", "math", "algebra", "calculus", "geometry", 
-            "trigonometry", "statistics", "step by step", "solution"
-        ]
-        
         # Check if query already contains math keywords
-        query_lower = query.lower()
-        has_math_keywords = any(keyword in query_lower for keyword in math_keywords)
-        
-        if not has_math_keywords:
+        if not _MATH_QUERY_KEYWORDS.search(query):
             return f"{query} mathematics step by step solution"
         
         return query
     
     def _is_math_related(self, content: str) -> bool:
         """Check if content is mathematically relevant"""
-        math_indicators = [
-            "equation", "formula", "solve", "calculate", "derivative", 
-            "integral", "algebra", "geometry", "trigonometry", "statistics",
-            "step", "solution", "answer", "mathematical", "math"
-        ]
+        return _MATH_CONTENT_INDICATORS.search(content) is not None
+    
+    def _compact(self, content: str, max_chars: int = EXPLANATION_CHARS_PER_RESULT,
+                 seen: Optional[set] = None) -> str:
+        """Drop boilerplate and repeated sentences, keeping leading sentences up to max_chars
         
-        content_lower = content.lower()
-        return any(indicator in content_lower for indicator in math_indicators)
+        Sentences already in ``seen`` (normalized) are skipped, so passing one set
+        across several results removes near-identical sentences between them.
+        """
+        seen = set() if seen is None else seen
+        kept = []
+        length = 0
+        for sentence in _SENTENCE_SPLIT.split(" ".join(content.split())):
+            key = _NON_WORD.sub("", sentence.lower())
+            if not key or key in seen or _BOILERPLATE.search(sentence):
+                continue
+            if length + len(sentence) > max_chars and kept:
+                break
+            seen.add(key)
+            kept.append(sentence[:max_chars])
+            length += len(kept[-1]) + 1
+        return " ".join(kept)
     
     async def _fallback_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
         """Fallback search using MCP server"""
+        # With both providers unavailable, web search is skipped entirely
+        if not self.mcp_breaker.allow():
+            return []
+        
         try:
             # Try to connect to MCP server
-            response = await self.session.post(
+            response = await self._post(
                 f"{self.mcp_server_url}/search",
                 json={"query": query, "max_results": max_results}
             )
             
             if response.status_code == 200:
                 data = response.json()
+                self.mcp_breaker.record_success()
                 return data.get("results", [])
             else:
                 print(f"MCP server error: {response.status_code}")
+                self.mcp_breaker.record_failure()
                 return []
                 
         except Exception as e:
             print(f"Error in MCP fallback search: {e}")
+            self.mcp_breaker.record_failure()
             return []
     
     async def get_math_explanation(self, topic: str, difficulty: str = "intermediate") -> Optional[Dict[str, Any]]:
@@ -107,8 +242,12 @@ class WebSearchMCP:
             combined_content = []
             sources = []
             
+            seen_sentences = set()
+            
             for result in results:
-                combined_content.append(result["content"])
+                compacted = self._compact(result["content"], seen=seen_sentences)
+                if compacted:
+                    combined_content.append(compacted)
                 sources.append({
                     "title": result["title"],
                     "url": result["url"]
@@ -137,8 +276,7 @@ class WebSearchMCP:
             similar_solutions = []
             
             for result in results:
-                content = result["content"].lower()
-                if any(keyword in content for keyword in ["step", "solution", "answer"]):
+                if _SOLUTION_KEYWORDS.search(result["content"]):
                     verification_score += 0.3
                     similar_solutions.append({
                         "source": result["title"],
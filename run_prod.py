@@ -0,0 +1,17 @@
+import os
+import uvicorn
+
+# Production launch: uvloop/httptools, no auto-reload.
+# Keep a single worker: feedback sessions and the in-memory caches live in the
+# process, and every worker would repopulate the knowledge base; scale by
+# running more instances behind a load balancer instead.
+if __name__ == "__main__":
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WORKERS", 1)),
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
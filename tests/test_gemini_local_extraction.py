@@ -0,0 +1,51 @@
+from llm.gemini_client import GeminiClient
+
+# A typical Gemini reply: bold step headers, nested bullets and a bold final answer
+GEMINI_MARKDOWN = """To solve the quadratic equation $x^2 - 5x + 6 = 0$, we can factor it.
+
+**Step 1: Identify the coefficients**
+
+The equation is in the form $ax^2 + bx + c = 0$:
+* a = 1, b = -5
+* c = 6
+
+**Step 2: Factor the quadratic**
+
+We need two numbers that multiply to 6 and add to -5: $-2$ and $-3$.
+$(x - 2)(x - 3) = 0$
+
+**Step 3: Solve for x**
+
+* $x - 2 = 0 \\Rightarrow x = 2$
+* $x - 3 = 0 \\Rightarrow x = 3$
+
+**Final Answer:** The solutions are $x = 2$ and $x = 3$."""
+
+
+def test_bold_step_headers_are_steps_and_sub_bullets_are_not():
+    assert GeminiClient._local_extract_steps(GEMINI_MARKDOWN) == [
+        "Identify the coefficients",
+        "Factor the quadratic",
+        "Solve for x",
+    ]
+
+
+def test_bold_final_answer_is_returned_without_markup():
+    assert GeminiClient._local_extract_answer(GEMINI_MARKDOWN) == "The solutions are $x = 2$ and $x = 3$."
+
+
+def test_markdown_headers_keep_multiplication_and_subscripts():
+    text = "### Step 1: Compute 2*3*4 for x_1\n### Step 2: Check\n**Final Answer**: **24**"
+    assert GeminiClient._local_extract_steps(text) == ["Compute 2*3*4 for x_1", "Check"]
+    assert GeminiClient._local_extract_answer(text) == "24"
+
+
+def test_plain_bullets_are_used_when_there_are_no_numbered_steps():
+    text = "- Subtract 3 from both sides\n- Divide by 2\n\nAnswer: x = 2"
+    assert GeminiClient._local_extract_steps(text) == ["Subtract 3 from both sides", "Divide by 2"]
+    assert GeminiClient._local_extract_answer(text) == "x = 2"
+
+
+def test_malformed_results_are_empty_so_gemini_is_asked():
+    assert GeminiClient._local_extract_steps("No structure at all.") == []
+    assert GeminiClient._local_extract_answer("Final answer: **") == ""